@@ -0,0 +1,169 @@
+"""GRESimulation 性能基准测试: 记录各矩阵尺寸下的耗时、峰值内存与吞吐量, 并与基线对比"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from mri_gre import GRESimulation
+
+DEFAULT_SIZES = [64, 128, 256, 512, 1024, 2048]
+DEFAULT_IMPORT_BUDGET = 0.5  # 秒; 工作进程启动时导入仿真核心的耗时上限
+
+# 在全新解释器中测量导入耗时, 并检查是否意外导入了matplotlib
+_IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import mri_gre
+print(time.perf_counter() - start, 'matplotlib' in sys.modules)
+"""
+
+def _make_sim(matrix_size):
+    # 关闭图像缓存, 保证每次测量的都是实际计算
+    sim = GRESimulation(matrix_size=matrix_size, te=15, tr=100, flip_angle=30, image_cache_size=0)
+    sim.simulate_gre()
+    return sim
+
+def _run_parameter_effects(sim):
+    # 延迟导入: 只有这一项需要matplotlib, 其余数值项目与导入耗时检查不依赖它
+    import matplotlib
+    matplotlib.use('Agg')  # 基准测试不打开窗口
+    import matplotlib.pyplot as plt
+    fig = sim.simulate_parameter_effects()
+    plt.close(fig)
+
+# 基准项目: 名称 -> (准备函数, 被测函数, 每次调用处理的图像数)
+CASES = {
+    'create_phantom': (_make_sim, lambda sim: sim._create_phantom(), 1),
+    'simulate_gre': (_make_sim, lambda sim: sim.simulate_gre(), 1),
+    'add_noise': (_make_sim, lambda sim: sim.add_noise(snr=20), 1),
+    'simulate_parameter_effects': (_make_sim, _run_parameter_effects, 9),
+}
+
+def measure(case, matrix_size, repeats=3):
+    """
+    测量单个基准项目
+
+    返回:
+        包含耗时(取多次运行的最小值)、峰值内存和每秒像素数的字典
+    """
+    setup, func, images = CASES[case]
+    sim = setup(matrix_size)
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(sim)
+        times.append(time.perf_counter() - start)
+
+    # 单独运行一次测量峰值内存, 避免tracemalloc的开销影响计时
+    tracemalloc.start()
+    func(sim)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = min(times)
+    return {
+        'case': case,
+        'matrix_size': matrix_size,
+        'seconds': seconds,
+        'peak_bytes': peak,
+        'pixels_per_second': images * matrix_size**2 / seconds if seconds > 0 else float('inf'),
+    }
+
+def measure_import(repeats=5):
+    """
+    测量在全新进程中导入 mri_gre 的耗时(取多次最小值)
+
+    返回:
+        {'seconds': 导入耗时, 'imports_matplotlib': 是否导入了matplotlib}
+    """
+    times = []
+    imports_matplotlib = False
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', _IMPORT_PROBE], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        times.append(float(output[0]))
+        imports_matplotlib |= output[1] == 'True'
+    return {'seconds': min(times), 'imports_matplotlib': imports_matplotlib}
+
+def run_benchmarks(sizes=DEFAULT_SIZES, cases=None, repeats=3):
+    """运行所有基准项目, 返回结果字典"""
+    results = []
+    for case in cases or CASES:
+        for matrix_size in sizes:
+            result = measure(case, matrix_size, repeats)
+            print(f"{case:28s} {matrix_size:5d}  {result['seconds'] * 1000:10.2f} ms  "
+                  f"{result['peak_bytes'] / 2**20:9.1f} MiB  {result['pixels_per_second'] / 1e6:10.2f} Mpx/s")
+            results.append(result)
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+def compare(current, baseline, tolerance=0.2):
+    """
+    与基线结果对比, 耗时或峰值内存超过基线 (1 + tolerance) 倍的项目视为回归
+
+    返回:
+        回归描述字符串列表
+    """
+    baseline_index = {(r['case'], r['matrix_size']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        base = baseline_index.get((result['case'], result['matrix_size']))
+        if base is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if base[metric] > 0 and result[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{result['case']} @ {result['matrix_size']}: {metric} "
+                                   f"{base[metric]:.4g} -> {result[metric]:.4g} "
+                                   f"(+{(result[metric] / base[metric] - 1) * 100:.0f}%)")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='GRESimulation 性能基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='矩阵尺寸列表')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), help='只运行指定的基准项目')
+    parser.add_argument('--repeats', type=int, default=3, help='每个项目的重复次数')
+    parser.add_argument('--output', help='将结果保存为JSON文件')
+    parser.add_argument('--baseline', help='用于对比的基线JSON文件')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的相对退化比例')
+    parser.add_argument('--import-budget', type=float, default=DEFAULT_IMPORT_BUDGET, help='导入耗时上限(秒)')
+    args = parser.parse_args(argv)
+
+    import_result = measure_import()
+    print(f"{'import mri_gre':28s}        {import_result['seconds'] * 1000:10.2f} ms  "
+          f"matplotlib: {'已导入' if import_result['imports_matplotlib'] else '未导入'}")
+    current = run_benchmarks(args.sizes, args.cases, args.repeats)
+    current['import'] = import_result
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+
+    status = 0
+    if import_result['imports_matplotlib'] or import_result['seconds'] > args.import_budget:
+        print(f"导入超出预算: {import_result['seconds']:.3f} s (上限 {args.import_budget} s), "
+              f"matplotlib {'已' if import_result['imports_matplotlib'] else '未'}导入")
+        status = 1
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance)
+        for line in regressions:
+            print(f"性能回归: {line}")
+        if regressions:
+            return 1
+        print("未发现性能回归")
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
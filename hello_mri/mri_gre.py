@@ -1,17 +1,694 @@
+import csv
+import functools
+import hashlib
+import itertools
+import json
+import os
+import queue
+import struct
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-from matplotlib.colors import LogNorm
-import matplotlib.pyplot as plt
 
-# 方法1：设置默认字体
-plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']  # 或 'SimHei', 'SimSun'
-plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+@functools.lru_cache(maxsize=None)
+def _pyplot():
+    """延迟导入matplotlib: 只有调用绘图方法时才导入并设置字体, 仿真核心不依赖matplotlib"""
+    import matplotlib.pyplot as plt
+    
+    # 方法1：设置默认字体
+    plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']  # 或 'SimHei', 'SimSun'
+    plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+    return plt
+
+def gre_signal(t1, t2, pd, te, tr, flip_angle):
+    """
+    向量化的GRE稳态信号方程, 所有参数按NumPy规则相互广播
+    
+    参数:
+        t1, t2, pd: 组织参数(ms, ms, 质子密度)
+        te, tr: 回波时间与重复时间(ms)
+        flip_angle: 翻转角(弧度)
+    """
+    t1 = np.asarray(t1, dtype=float)
+    t2 = np.asarray(t2, dtype=float)
+    pd = np.asarray(pd, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        e1 = np.where(t1 > 0, np.exp(-tr / t1), 0.0)
+        e2 = np.where(t2 > 0, np.exp(-te / t2), 0.0)
+        m_xy = pd * np.sin(flip_angle) * (1 - e1) / (1 - np.cos(flip_angle) * e1) * e2
+    return np.where(pd == 0, 0.0, m_xy)  # 空气没有信号
+
+def gre_signal_gradient(t1, t2, pd, te, tr, flip_angle):
+    """
+    GRE稳态信号及其对序列参数的解析偏导数, 所有参数可相互广播
+    
+    返回:
+        (S, dS/dTE, dS/dTR, dS/dα), α 以弧度计
+    """
+    t1 = np.asarray(t1, dtype=float)
+    t2 = np.asarray(t2, dtype=float)
+    pd = np.asarray(pd, dtype=float)
+    cos_a, sin_a = np.cos(flip_angle), np.sin(flip_angle)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        e1 = np.where(t1 > 0, np.exp(-tr / t1), 0.0)
+        e2 = np.where(t2 > 0, np.exp(-te / t2), 0.0)
+        denom = 1 - cos_a * e1
+        signal = pd * sin_a * (1 - e1) / denom * e2
+        d_te = np.where(t2 > 0, -signal / t2, 0.0)
+        d_tr = np.where(t1 > 0, pd * sin_a * e2 * (1 - cos_a) * e1 / (t1 * denom**2), 0.0)
+        d_flip = pd * (1 - e1) * e2 * (cos_a - e1) / denom**2
+    return tuple(np.where(pd == 0, 0.0, v) for v in (signal, d_te, d_tr, d_flip))
+
+def _sweep_block_worker(shm_name, label_shape, label_dtype, tissue_arrays, te, tr, flip,
+                        signal_equation=gre_signal, equation_kwargs=None):
+    """子进程中计算一个参数块: 通过共享内存读取标签图, 避免每个任务都序列化整幅模型"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        labels = np.ndarray(label_shape, dtype=label_dtype, buffer=shm.buf)
+        t1, t2, pd = tissue_arrays
+        te_g, tr_g, flip_g = np.meshgrid(te, tr, flip, indexing='ij')
+        table = signal_equation(t1, t2, pd, te_g[..., None], tr_g[..., None], flip_g[..., None] * np.pi / 180,
+                                **(equation_kwargs or {}))
+        block = table[..., labels]
+        if np.iscomplexobj(block):
+            return np.abs(block)
+        return np.abs(block, out=block)  # 实数信号原地取幅值, 不再多占一份块内存
+    finally:
+        shm.close()
+
+def _shape_bbox(shape_spec, grid_shape):
+    """计算形状的像素包围盒 (y0, y1, x0, x1), 已裁剪到图像范围内"""
+    kind = shape_spec['type']
+    if kind == 'polygon':
+        vertices = np.asarray(shape_spec['vertices'], dtype=float)
+        x_min, y_min = vertices.min(axis=0)
+        x_max, y_max = vertices.max(axis=0)
+    else:
+        cx, cy = shape_spec['center']
+        if kind == 'circle':
+            half_w = half_h = shape_spec['radius']
+        else:
+            a, b = shape_spec['axes']
+            theta = np.deg2rad(shape_spec.get('angle', 0))
+            half_w = np.hypot(a * np.cos(theta), b * np.sin(theta))
+            half_h = np.hypot(a * np.sin(theta), b * np.cos(theta))
+        x_min, x_max = cx - half_w, cx + half_w
+        y_min, y_max = cy - half_h, cy + half_h
+    rows, cols = grid_shape
+    # 向外多取一个像素, 避免浮点误差漏掉边界像素
+    y0, y1 = max(int(np.floor(y_min)) - 1, 0), min(int(np.ceil(y_max)) + 2, rows)
+    x0, x1 = max(int(np.floor(x_min)) - 1, 0), min(int(np.ceil(x_max)) + 2, cols)
+    return y0, y1, x0, x1
+
+def _shape_mask(shape_spec, y, x):
+    """在给定的像素坐标(ogrid)上计算形状掩膜"""
+    kind = shape_spec['type']
+    if kind == 'circle':
+        cx, cy = shape_spec['center']
+        dist = np.sqrt((x - cx)**2 + (y - cy)**2)
+        mask = dist <= shape_spec['radius']
+        if shape_spec.get('inner_radius', 0) > 0:  # 圆环
+            mask &= dist >= shape_spec['inner_radius']
+        return mask
+    if kind == 'ellipse':
+        cx, cy = shape_spec['center']
+        a, b = shape_spec['axes']
+        theta = np.deg2rad(shape_spec.get('angle', 0))
+        dx, dy = x - cx, y - cy
+        u = dx * np.cos(theta) + dy * np.sin(theta)
+        v = -dx * np.sin(theta) + dy * np.cos(theta)
+        return (u / a)**2 + (v / b)**2 <= 1
+    if kind == 'polygon':
+        # 射线法(奇偶规则)判断像素中心是否在多边形内
+        vertices = np.asarray(shape_spec['vertices'], dtype=float)
+        inside = np.zeros(np.broadcast_shapes(y.shape, x.shape), dtype=bool)
+        for (x_a, y_a), (x_b, y_b) in zip(vertices, np.roll(vertices, -1, axis=0)):
+            if y_a == y_b:
+                continue
+            crosses = (y_a > y) != (y_b > y)
+            x_cross = x_a + (y - y_a) * (x_b - x_a) / (y_b - y_a)
+            inside ^= crosses & (x < x_cross)
+        return inside
+    raise ValueError(f"未知的形状类型: {kind}")
+
+def rasterize_shapes(grid_shape, shapes, dtype=np.uint8):
+    """
+    将形状列表按顺序绘制为组织标签图, 后绘制的形状覆盖先绘制的形状
+    
+    参数:
+        grid_shape: 标签图形状 (行, 列)
+        shapes: 形状描述字典列表, 每个字典包含 'type' 与 'label', 支持:
+            {'type': 'circle', 'center': (x, y), 'radius': r, 'inner_radius': r0(可选, 圆环)}
+            {'type': 'ellipse', 'center': (x, y), 'axes': (a, b), 'angle': 度(可选)}
+            {'type': 'polygon', 'vertices': [(x, y), ...]}
+        dtype: 标签图数据类型
+    """
+    labels = np.zeros(grid_shape, dtype=dtype)
+    for shape_spec in shapes:
+        # 只在形状的包围盒内计算, 而不是每个形状都遍历整幅图像
+        y0, y1, x0, x1 = _shape_bbox(shape_spec, grid_shape)
+        if y0 >= y1 or x0 >= x1:
+            continue
+        y, x = np.ogrid[y0:y1, x0:x1]
+        labels[y0:y1, x0:x1][_shape_mask(shape_spec, y, x)] = shape_spec['label']
+    return labels
+
+def bloch_simulate(t1, t2, pd, te, tr, flip_angle, num_trs=200, num_isochromats=100,
+                   off_resonance=0.0, spoiler_cycles=1.0, rf_spoiling=False, spoil_increment=117.0,
+                   dtype=np.float32, chunk_size=1024):
+    """
+    Bloch方程时间步进仿真, 对所有体素与体素内自旋等色线做向量化演化
+    
+    横向磁化以复数 M+ = Mx + iMy 表示, 射频旋转与自由进动都化为复数乘加运算
+    
+    参数:
+        t1, t2, pd: 每个体素的组织参数(一维数组, ms, ms, 质子密度)
+        te, tr: 回波时间与重复时间(ms)
+        flip_angle: 翻转角(弧度)
+        num_trs: 仿真的TR个数
+        num_isochromats: 每个体素的自旋等色线数
+        off_resonance: 每个体素的偏共振频率(Hz), 标量或一维数组
+        spoiler_cycles: 扰相梯度在一个TR内使体素内相位散开的周期数, 0表示无梯度扰相
+        rf_spoiling: 是否使用射频扰相(二次相位递增)
+        spoil_increment: 射频扰相的相位增量(度)
+        dtype: 计算精度, np.float32 可显著提速
+        chunk_size: 每块处理的体素数, 限制内存占用并保持缓存友好
+    
+    返回:
+        形状为 (num_trs, 体素数) 的复数回波信号, 已按射频相位解调
+    """
+    t1 = np.asarray(t1, dtype=float)
+    t2 = np.asarray(t2, dtype=float)
+    pd = np.asarray(pd, dtype=float)
+    off_resonance = np.broadcast_to(np.asarray(off_resonance, dtype=float), pd.shape)
+    complex_dtype = np.result_type(dtype, np.complex64)
+    signals = np.zeros((num_trs, pd.size), dtype=complex_dtype)
+    
+    # 射频相位: 射频扰相时按二次规律递增
+    n = np.arange(num_trs)
+    rf_phase = np.deg2rad(spoil_increment) * n * (n + 1) / 2 if rf_spoiling else np.zeros(num_trs)
+    rf_phasor = np.exp(1j * rf_phase)
+    cos_a, sin_a = np.cos(flip_angle), np.sin(flip_angle)
+    cos_half_sq, sin_half_sq = np.cos(flip_angle / 2)**2, np.sin(flip_angle / 2)**2
+    
+    # 体素内等色线的频率偏移(每个TR内的相位周期数)
+    iso_cycles = ((np.arange(num_isochromats) + 0.5) / num_isochromats - 0.5) * spoiler_cycles
+    
+    # 空气体素没有信号, 不参与演化
+    active = np.flatnonzero(pd > 0)
+    for start in range(0, active.size, chunk_size):
+        idx = active[start:start + chunk_size]
+        m0 = pd[idx, None]
+        # 每块只计算一次弛豫与进动因子, 在所有TR中复用
+        rad_per_ms = 2 * np.pi * (off_resonance[idx, None] / 1000 + iso_cycles / tr)
+        precession = []
+        for t in (te, tr - te):
+            e1 = np.exp(-t / t1[idx, None])
+            phasor = (np.exp(-t / t2[idx, None]) * np.exp(1j * rad_per_ms * t)).astype(complex_dtype)
+            precession.append((phasor, e1.astype(dtype), (m0 * (1 - e1)).astype(dtype)))
+        
+        mxy = np.zeros((idx.size, num_isochromats), dtype=complex_dtype)
+        mz = np.repeat(m0, num_isochromats, axis=1).astype(dtype)
+        conj_term = np.empty_like(mxy)
+        for k in range(num_trs):
+            # 射频脉冲: 绕相位为 rf_phase 的横向轴旋转 flip_angle
+            mz_from_xy = (mxy * np.conj(rf_phasor[k])).imag
+            mz_from_xy *= sin_a
+            np.conjugate(mxy, out=conj_term)
+            conj_term *= sin_half_sq * rf_phasor[k]**2
+            mxy *= cos_half_sq
+            mxy += conj_term
+            mxy += (-1j * sin_a * rf_phasor[k]) * mz
+            mz *= cos_a
+            mz += mz_from_xy
+            
+            # 演化到TE并读出, 再演化到TR结束
+            for phase, (phasor, e1, recovery) in enumerate(precession):
+                mxy *= phasor
+                mz *= e1
+                mz += recovery
+                if phase == 0:
+                    signals[k, idx] = mxy.mean(axis=1) * np.conj(rf_phasor[k])
+    return signals
+
+@functools.lru_cache(maxsize=None)
+def _centered_fft_indices(rows, cols):
+    """预计算中心化FFT所需的移位索引 (fftshift, ifftshift), 相同几何尺寸的重复重建直接复用"""
+    shift = (np.fft.fftshift(np.arange(rows))[:, None], np.fft.fftshift(np.arange(cols)))
+    ishift = (np.fft.ifftshift(np.arange(rows))[:, None], np.fft.ifftshift(np.arange(cols)))
+    return shift, ishift
+
+def fft2c(image):
+    """中心化的正交二维FFT, 对最后两维计算, 前面的维度(层/线圈)一次性批量处理"""
+    (sy, sx), (iy, ix) = _centered_fft_indices(*image.shape[-2:])
+    return np.fft.fft2(image[..., iy, ix], norm='ortho')[..., sy, sx]
+
+def ifft2c(kspace):
+    """中心化的正交二维逆FFT, 对最后两维计算, 前面的维度(层/线圈)一次性批量处理"""
+    (sy, sx), (iy, ix) = _centered_fft_indices(*kspace.shape[-2:])
+    return np.fft.ifft2(kspace[..., iy, ix], norm='ortho')[..., sy, sx]
+
+def sampling_mask(num_lines, partial_fourier=1.0, acceleration=1, center_lines=0):
+    """
+    笛卡尔逐行采集的相位编码行掩膜
+    
+    参数:
+        num_lines: 相位编码行数
+        partial_fourier: 部分傅里叶比例(0.5~1.0), 从k空间一端开始只采集该比例的行
+        acceleration: 欠采样加速因子, 每隔 acceleration 行采集一行
+        center_lines: k空间中心始终全采样的行数(自校准区)
+    
+    k空间中心行(DC)与自校准区不受部分傅里叶截断和欠采样影响, 始终被采集
+    """
+    lines = np.arange(num_lines)
+    mask = lines % acceleration == 0
+    mask &= lines < int(np.ceil(partial_fourier * num_lines))
+    center_start = num_lines // 2 - center_lines // 2
+    mask[center_start:center_start + center_lines] = True
+    mask[num_lines // 2] = True
+    return mask
+
+def coil_sensitivity_maps(num_coils, shape, coil_radius=1.2, coil_width=0.6):
+    """
+    生成均匀分布在成像视野周围的多通道线圈灵敏度图, 所有线圈一次性批量计算
+    
+    参数:
+        num_coils: 线圈通道数
+        shape: 图像形状 (行, 列)
+        coil_radius: 线圈所在圆的半径(相对于半个视野)
+        coil_width: 灵敏度随距离衰减的宽度(相对于半个视野)
+    
+    返回:
+        形状为 (num_coils, 行, 列) 的复数灵敏度图
+    """
+    rows, cols = shape
+    y = (np.arange(rows) - rows / 2) / (rows / 2)
+    x = (np.arange(cols) - cols / 2) / (cols / 2)
+    angles = 2 * np.pi * np.arange(num_coils) / num_coils
+    coil_x = (coil_radius * np.cos(angles))[:, None, None]
+    coil_y = (coil_radius * np.sin(angles))[:, None, None]
+    dist_sq = (x[None, None, :] - coil_x)**2 + (y[None, :, None] - coil_y)**2
+    # 幅值随距离高斯衰减, 相位随线圈位置变化
+    magnitude = np.exp(-dist_sq / (2 * coil_width**2))
+    phase = np.arctan2(y[None, :, None] - coil_y, x[None, None, :] - coil_x)
+    return magnitude * np.exp(1j * phase)
+
+def rss_combine(coil_images, axis=0):
+    """平方和开方(RSS)合并多线圈图像"""
+    return np.sqrt(np.sum(np.abs(coil_images)**2, axis=axis))
+
+def fold_coil_images(coil_images, acceleration):
+    """
+    沿相位编码方向(倒数第二维)按加速因子折叠图像,
+    等价于在k空间每隔 acceleration 行采集一行造成的混叠
+    """
+    *lead, rows, cols = coil_images.shape
+    if rows % acceleration:
+        raise ValueError(f"行数 {rows} 不能被加速因子 {acceleration} 整除")
+    return coil_images.reshape(*lead, acceleration, rows // acceleration, cols).sum(axis=-3)
+
+def sense_unfold(aliased, sensitivities, acceleration, regularization=1e-6):
+    """
+    SENSE展开: 对所有混叠像素一次性批量求解最小二乘问题
+    
+    参数:
+        aliased: 混叠的多线圈图像, 形状 (线圈, 行/加速因子, 列)
+        sensitivities: 线圈灵敏度图, 形状 (线圈, 行, 列)
+        acceleration: 加速因子
+        regularization: Tikhonov正则化系数, 避免无信号区域的矩阵奇异
+    
+    返回:
+        展开后的复数图像, 形状 (行, 列)
+    """
+    num_coils, rows, cols = sensitivities.shape
+    folded_rows = rows // acceleration
+    # 每个混叠像素对应一个 线圈×加速因子 的编码矩阵, 形状 (行/R, 列, 线圈, R)
+    encoding = sensitivities.reshape(num_coils, acceleration, folded_rows, cols).transpose(2, 3, 0, 1)
+    measured = aliased.transpose(1, 2, 0)[..., None]
+    encoding_h = np.conj(np.swapaxes(encoding, -1, -2))
+    normal = encoding_h @ encoding + regularization * np.eye(acceleration)
+    unfolded = np.linalg.solve(normal, encoding_h @ measured)[..., 0]
+    return unfolded.transpose(2, 0, 1).reshape(rows, cols)
+
+def normalize_image(image):
+    """将信号幅值线性归一化为 0~255 的 uint8 图像"""
+    image = np.abs(np.asarray(image))
+    low, high = image.min(), image.max()
+    if high <= low:
+        return np.zeros(image.shape, dtype=np.uint8)
+    return ((image - low) * (255 / (high - low))).round().astype(np.uint8)
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+def write_png(path, image, compress_level=6):
+    """不经过matplotlib, 直接将二维图像归一化后编码为8位灰度PNG"""
+    pixels = normalize_image(image)
+    if pixels.ndim != 2:
+        raise ValueError(f"PNG只支持二维图像, 实际形状为 {pixels.shape}")
+    height, width = pixels.shape
+    # 每行前加一个过滤类型字节(0: 不过滤)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), pixels]).tobytes()
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+        f.write(_png_chunk(b'IDAT', zlib.compress(raw, compress_level)))
+        f.write(_png_chunk(b'IEND', b''))
+    return path
+
+def write_image(path, image):
+    """按扩展名写出图像: .png 为归一化灰度图, .npz 为归一化数组(可为多维)"""
+    if path.endswith('.npz'):
+        np.savez(path, image=normalize_image(image))
+    else:
+        write_png(path, image)
+    return path
+
+def complex_noise(rng, shape, sigma, dtype=complex, out=None):
+    """
+    一次生成复高斯噪声: 实部与虚部各自服从 N(0, sigma²)
+    
+    直接在复数数组的实数视图上原地生成标准正态数并缩放, 不分配额外的实部/虚部数组
+    
+    参数:
+        rng: np.random.Generator
+        shape: 噪声形状
+        sigma: 实部/虚部的标准差
+        dtype: 复数类型, np.complex64 时以float32生成, 速度更快
+        out: 可选的输出数组
+    """
+    noise = np.empty(shape, dtype=dtype) if out is None else out
+    parts = noise.view(noise.real.dtype)
+    rng.standard_normal(out=parts, dtype=parts.dtype)
+    parts *= sigma
+    return noise
+
+class RunningStats:
+    """Welford流式统计: 逐个样本更新逐像素均值与方差, 内存占用与样本数无关"""
+    
+    def __init__(self, shape):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)  # 与均值之差的平方和
+    
+    def update(self, sample):
+        self.count += 1
+        delta = sample - self.mean
+        self.mean += delta / self.count
+        delta *= sample - self.mean
+        self.m2 += delta
+    
+    def merge(self, other):
+        """合并另一组统计量(并行算法), 用于汇总各工作进程的结果"""
+        total = self.count + other.count
+        if other.count == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean += delta * (other.count / total)
+        self.m2 += other.m2 + delta**2 * (self.count * other.count / total)
+        self.count = total
+        return self
+    
+    @property
+    def variance(self):
+        """样本方差(无偏)"""
+        return self.m2 / max(self.count - 1, 1)
+
+def _monte_carlo_worker(clean, sigma, num_realisations, seed_sequence):
+    """在一个随机数子流上运行若干次噪声实现, 返回流式统计量"""
+    rng = np.random.default_rng(seed_sequence)
+    stats = RunningStats(clean.shape)
+    noisy = np.empty_like(clean)
+    for _ in range(num_realisations):
+        complex_noise(rng, clean.shape, sigma, dtype=clean.dtype, out=noisy)
+        noisy += clean
+        stats.update(np.abs(noisy))
+    return stats
+
+class ImageWriter:
+    """
+    后台图像写出线程, 使仿真与图像编码/写盘重叠进行
+    
+    用法:
+        with ImageWriter() as writer:
+            writer.submit('a.png', image)
+    """
+    
+    def __init__(self, max_pending=16):
+        self._queue = queue.Queue(maxsize=max_pending)  # 有界队列, 编码跟不上时让仿真等待
+        self._errors = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                write_image(*item)
+            except Exception as exc:  # 保存异常, 在 close 时抛出
+                self._errors.append(exc)
+    
+    def submit(self, path, image):
+        """提交一幅图像; 图像会被复制, 调用方可立即复用原数组"""
+        self._queue.put((path, np.array(image)))
+    
+    def close(self):
+        """等待所有图像写完并停止线程"""
+        self._queue.put(None)
+        self._thread.join()
+        if self._errors:
+            raise self._errors[0]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _memmap_npz_member(path, archive, info):
+    """将未压缩 .npz 中的一个数组直接内存映射, 不读入内存"""
+    with archive.open(info) as member:
+        version = np.lib.format.read_magic(member)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(member)
+        header_size = member.tell()
+    with open(path, 'rb') as f:
+        # 本地文件头长度为30字节加上文件名与扩展字段
+        f.seek(info.header_offset + 26)
+        name_len, extra_len = struct.unpack('<HH', f.read(4))
+    offset = info.header_offset + 30 + name_len + extra_len + header_size
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape, offset=offset,
+                     order='F' if fortran_order else 'C')
+
+def load_parametric_maps(source):
+    """
+    加载逐体素参数图(t1, t2, pd, 可选 t2star), 尽量以内存映射方式打开而不复制
+    
+    参数:
+        source: .npz 文件路径(未压缩成员直接内存映射, 压缩成员读入内存),
+                或 {名称: .npy路径或数组} 字典(.npy 以只读内存映射打开)
+    
+    返回:
+        {名称: 数组} 字典
+    """
+    if isinstance(source, str):
+        maps = {}
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                name = info.filename[:-len('.npy')]
+                if info.compress_type == zipfile.ZIP_STORED:
+                    maps[name] = _memmap_npz_member(source, archive, info)
+                else:
+                    with archive.open(info) as member:
+                        maps[name] = np.lib.format.read_array(member)
+        return maps
+    return {name: np.load(value, mmap_mode='r') if isinstance(value, str) else value
+            for name, value in source.items()}
+
+class TissueLibrary:
+    """
+    组织参数库: 每个字段各存为一个按标签索引的连续NumPy数组, 查表通过花式索引完成
+    
+    字段(均按标签索引): t1, t2, t2star(ms), pd(质子密度), off_resonance(Hz)
+    """
+    
+    FIELDS = ('t1', 't2', 't2star', 'pd', 'off_resonance')
+    
+    def __init__(self):
+        self.names = []
+        self._labels = {}
+        self._arrays = {field: np.zeros(0) for field in self.FIELDS}
+    
+    @classmethod
+    def from_arrays(cls, names, t1, t2, pd, t2star=None, off_resonance=None):
+        """
+        由按标签排列的参数序列一次性构建组织库
+        
+        参数:
+            names: 组织名称序列, 标签按顺序从0开始编号
+            t2star: 缺省时取 t2; off_resonance: 缺省时为0
+        """
+        library = cls()
+        library.names = list(names)
+        library._labels = {name: label for label, name in enumerate(library.names)}
+        if len(library._labels) != len(library.names):
+            raise ValueError("组织名称不能重复")
+        t2 = np.array(t2, dtype=float)
+        columns = {
+            't1': t1, 't2': t2, 't2star': t2 if t2star is None else t2star, 'pd': pd,
+            'off_resonance': np.zeros(len(library.names)) if off_resonance is None else off_resonance,
+        }
+        for field, values in columns.items():
+            values = np.array(values, dtype=float)
+            if values.shape != (len(library.names),):
+                raise ValueError(f"字段 {field} 的长度与组织数不一致")
+            library._arrays[field] = values
+        return library
+    
+    @classmethod
+    def default(cls):
+        """内置的五种组织; T2*取T2值, 与原始仿真的简化保持一致"""
+        library = cls()
+        library.add('air', 0, 0, 0)
+        library.add('csf', 4000, 2000, 1.0)
+        library.add('gray_matter', 1100, 95, 0.8)
+        library.add('white_matter', 800, 80, 0.65)
+        library.add('muscle', 900, 50, 0.7)
+        return library
+    
+    @classmethod
+    def load(cls, path):
+        """
+        从文件加载组织库, 标签按文件中的顺序从0开始编号
+        
+        支持:
+            .csv: 表头为 name,t1,t2,pd, 可选列 t2star,off_resonance
+            .json: 对象列表, 键与CSV表头相同
+        """
+        with open(path, encoding='utf-8') as f:
+            if path.endswith('.json'):
+                rows = json.load(f)
+            else:
+                rows = list(csv.DictReader(f))
+        
+        # 重复的组织名以最后一行为准, 标签保持首次出现的位置
+        latest = {}
+        for row in rows:
+            latest[row['name']] = row
+        rows = list(latest.values())
+        
+        def column(key, default=None):
+            """解析一列; 可选列缺失或为空时使用 default(row)"""
+            if default is None:
+                return [float(row[key]) for row in rows]
+            return [float(row[key]) if row.get(key) not in (None, '') else default(row) for row in rows]
+        
+        # 逐列解析后一次性构建数组, 避免逐行插入
+        return cls.from_arrays(list(latest), column('t1'), column('t2'), column('pd'),
+                               t2star=column('t2star', lambda row: float(row['t2'])),
+                               off_resonance=column('off_resonance', lambda row: 0.0))
+    
+    def add(self, name, t1, t2, pd, t2star=None, off_resonance=0.0):
+        """添加一种组织(或更新已有组织), 返回其标签"""
+        values = dict(zip(self.FIELDS, (t1, t2, t2 if t2star is None else t2star, pd, off_resonance)))
+        if name in self._labels:
+            for field, value in values.items():
+                self._arrays[field][self._labels[name]] = value
+        else:
+            self._labels[name] = len(self.names)
+            self.names.append(name)
+            for field, value in values.items():
+                self._arrays[field] = np.append(self._arrays[field], float(value))
+        return self._labels[name]
+    
+    def label(self, name):
+        return self._labels[name]
+    
+    def __len__(self):
+        return len(self.names)
+    
+    # 各参数以连续数组形式按标签返回
+    t1 = property(lambda self: self._arrays['t1'])
+    t2 = property(lambda self: self._arrays['t2'])
+    t2star = property(lambda self: self._arrays['t2star'])
+    pd = property(lambda self: self._arrays['pd'])
+    off_resonance = property(lambda self: self._arrays['off_resonance'])
+    
+    def params(self, name):
+        """以字典形式返回某种组织的参数"""
+        label = self._labels[name]
+        return {field: float(self._arrays[field][label]) for field in self.FIELDS}
+    
+    def fingerprint(self):
+        """参数表内容的哈希, 用作缓存键"""
+        digest = hashlib.blake2b(digest_size=16)
+        for field in self.FIELDS:
+            digest.update(self._arrays[field].data)
+        return digest.hexdigest()
+
+class LRUCache:
+    """
+    有条目数上限和可选字节数上限的LRU缓存, 记录命中与未命中次数
+    
+    参数:
+        maxsize: 最多缓存的条目数
+        maxbytes: 缓存值(按 nbytes 计, 非数组按0计)总字节数上限, None表示不限;
+                  单个超过上限的值不会被缓存
+    """
+    
+    def __init__(self, maxsize=128, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+    
+    def get(self, key, compute):
+        """返回缓存值; 未命中时调用 compute() 计算并存入缓存"""
+        if key in self._data:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+        self.misses += 1
+        value = compute()
+        size = getattr(value, 'nbytes', 0)
+        if self.maxsize > 0 and (self.maxbytes is None or size <= self.maxbytes):
+            self._data[key] = value
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= getattr(evicted, 'nbytes', 0)
+        return value
+    
+    def clear(self):
+        self._data.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize,
+                'nbytes': self.nbytes, 'maxbytes': self.maxbytes}
 
 class GRESimulation:
     """简易的梯度回波(GRE)序列磁共振仿真类"""
     
-    def __init__(self, fov=240, matrix_size=128, num_tissues=4, te=10, tr=100, flip_angle=30):
+    # 序列的向量化信号方程, 签名为 (t1, t2, pd, te, tr, flip_angle, **额外参数); 子类替换它来实现其他序列
+    signal_equation = staticmethod(gre_signal)
+    # 信号方程使用的横向弛豫时间: GRE 使用 T2*, 自旋回波类序列使用 T2
+    transverse_relaxation = 't2star'
+    
+    def __init__(self, fov=240, matrix_size=128, num_tissues=4, te=10, tr=100, flip_angle=30, phantom_shapes=None,
+                 num_slices=None, storage_dir=None, signal_dtype=complex, tissue_cache_size=1024,
+                 image_cache_size=8, image_cache_bytes=64 * 2**20, seed=None, tissues=None):
         """
         初始化GRE仿真参数
         
@@ -22,10 +699,22 @@ class GRESimulation:
             te: 回波时间(ms)
             tr: 重复时间(ms)
             flip_angle: 翻转角(度)
+            phantom_shapes: 自定义数字模型的形状列表(见 rasterize_shapes), 默认使用内置头部模型
+            num_slices: 层数; 为None时使用二维模型, 否则使用 层数×矩阵×矩阵 的三维体模型
+            storage_dir: 若给定, 模型与信号以 np.memmap(.npy) 文件形式保存在该目录, 可超出物理内存
+            signal_dtype: 信号数组的数据类型, 例如 np.complex64 可减半内存
+            tissue_cache_size: 组织信号查找表LRU缓存的容量, 0表示不缓存
+            image_cache_size: 整幅仿真图像LRU缓存的容量, 0表示不缓存; 只缓存内存中的二维图像
+            image_cache_bytes: 整幅仿真图像缓存的总字节数上限, None表示不限
+            seed: 噪声随机数种子; 相同种子得到可复现的噪声
+            tissues: TissueLibrary 或组织库文件路径, 默认使用内置的五种组织
         """
         self.fov = fov
         self.matrix_size = matrix_size
         self.num_tissues = num_tissues
+        self.num_slices = num_slices
+        self.storage_dir = storage_dir
+        self.signal_dtype = signal_dtype
         self.te = te
         self.tr = tr
         self.flip_angle = flip_angle * np.pi / 180  # 转换为弧度
@@ -33,67 +722,242 @@ class GRESimulation:
         # 像素尺寸(mm)
         self.pixel_size = fov / matrix_size
         
-        # 创建空白图像
-        self.phantom = np.zeros((matrix_size, matrix_size))
-        self.signal = np.zeros((matrix_size, matrix_size), dtype=complex)
-        
-        # 组织参数: [T1(ms), T2(ms), 质子密度]
-        self.tissue_params = {
-            'air': [0, 0, 0],
-            'csf': [4000, 2000, 1.0],
-            'gray_matter': [1100, 95, 0.8],
-            'white_matter': [800, 80, 0.65],
-            'muscle': [900, 50, 0.7]
-        }
+        # 组织参数库, 按标签索引
+        if tissues is None:
+            tissues = TissueLibrary.default()
+        elif isinstance(tissues, str):
+            tissues = TissueLibrary.load(tissues)
+        self.tissues = tissues
+        
+        # 创建空白图像; 三维模式下整卷信号按需分配, 逐层仿真时不占用整卷内存
+        # 标签图使用能容纳所有组织标签的最小整数类型
+        shape = (matrix_size, matrix_size) if num_slices is None else (num_slices, matrix_size, matrix_size)
+        if storage_dir is not None:
+            os.makedirs(storage_dir, exist_ok=True)
+        label_dtype = np.promote_types(np.uint8, np.min_scalar_type(max(len(tissues) - 1, 0)))
+        self.phantom = self._allocate('phantom', shape, label_dtype)
+        self.signal = self._allocate('signal', shape, signal_dtype) if num_slices is None else None
+        
+        # 多线圈灵敏度图, 由 simulate_coils 生成
+        self.coil_sensitivities = None
+        
+        # k空间数据与采样掩码, 由 acquire_kspace 生成
+        self.kspace = None
+        self.kspace_mask = None
+        
+        # 每个仿真对象独立的随机数流, 可派生出互不相关的并行子流
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+        
+        # 信号缓存: 按组织库与序列参数索引的组织信号查找表, 以及按模型哈希与序列参数索引的整幅图像
+        self.tissue_cache = LRUCache(tissue_cache_size)
+        self.image_cache = LRUCache(image_cache_size, image_cache_bytes)
         
         # 创建简单的数字模型
+        self.phantom_shapes = phantom_shapes
         self._create_phantom()
     
-    def _create_phantom(self):
-        """创建简单的数字模型"""
-        center = self.matrix_size // 2
-        radius = self.matrix_size // 3
+    def _allocate(self, name, shape, dtype, fortran_order=False):
+        """分配零初始化数组; 设置了 storage_dir 时以 .npy 内存映射文件作为后端"""
+        if self.storage_dir is None:
+            return np.zeros(shape, dtype=dtype, order='F' if fortran_order else 'C')
+        return np.lib.format.open_memmap(os.path.join(self.storage_dir, f'{name}.npy'),
+                                         mode='w+', dtype=dtype, shape=shape, fortran_order=fortran_order)
+    
+    @staticmethod
+    def open_results(storage_dir, mode='r'):
+        """
+        以内存映射方式零拷贝地重新打开已保存的仿真结果, 无需重新仿真
         
-        # 背景为空气
-        self.phantom.fill(0)
+        返回:
+            (phantom, signal): 标签图与信号数组; 信号尚未生成时为None
+        """
+        phantom = np.load(os.path.join(storage_dir, 'phantom.npy'), mmap_mode=mode)
+        signal_path = os.path.join(storage_dir, 'signal.npy')
+        signal = np.load(signal_path, mmap_mode=mode) if os.path.exists(signal_path) else None
+        return phantom, signal
+    
+    def _default_phantom_shapes(self, scale=1.0):
+        """
+        内置头部模型的形状列表
         
-        # 创建头部轮廓(圆形)
-        y, x = np.ogrid[:self.matrix_size, :self.matrix_size]
-        dist_from_center = np.sqrt((x - center)**2 + (y - center)**2)
-        skull_mask = dist_from_center <= radius
-        self.phantom[skull_mask] = 1  # CSF
+        参数:
+            scale: 所有半径的缩放系数, 三维模式下用于生成头部两端较小的层面
+        """
+        if scale <= 0:
+            return []
+        center = self.matrix_size // 2
+        radius = self.matrix_size // 3 * scale
         
-        # 脑组织(灰质)
-        brain_mask = dist_from_center <= radius * 0.9
-        self.phantom[brain_mask] = 2  # 灰质
+        # 头部轮廓(圆形) - CSF, 脑组织(灰质)
+        shapes = [
+            {'type': 'circle', 'center': (center, center), 'radius': radius, 'label': 1},
+            {'type': 'circle', 'center': (center, center), 'radius': radius * 0.9, 'label': 2},
+        ]
         
         # 脑组织(白质) - 创建几个椭圆区域
         for i in range(-2, 3):
             for j in range(-2, 3):
                 if i == 0 and j == 0:
                     continue
-                x_center = center + i * radius * 0.3
-                y_center = center + j * radius * 0.3
-                
-                y, x = np.ogrid[:self.matrix_size, :self.matrix_size]
-                dist = np.sqrt((x - x_center)**2 + (y - y_center)**2)
-                white_matter_mask = dist <= radius * 0.15
-                self.phantom[white_matter_mask] = 3  # 白质
+                shapes.append({'type': 'circle',
+                               'center': (center + i * radius * 0.3, center + j * radius * 0.3),
+                               'radius': radius * 0.15, 'label': 3})
         
         # 添加肌肉组织在头部周围
-        muscle_region = (dist_from_center >= radius * 0.95) & (dist_from_center <= radius * 1.05)
-        self.phantom[muscle_region] = 4  # 肌肉
-    
-    def simulate_gre(self):
-        """模拟GRE序列并生成信号"""
-        # 组织类型映射到参数
-        tissue_to_params = {
-            0: self.tissue_params['air'],
-            1: self.tissue_params['csf'],
-            2: self.tissue_params['gray_matter'],
-            3: self.tissue_params['white_matter'],
-            4: self.tissue_params['muscle']
-        }
+        shapes.append({'type': 'circle', 'center': (center, center), 'radius': radius * 1.05,
+                       'inner_radius': radius * 0.95, 'label': 4})
+        return shapes
+    
+    def _create_phantom(self):
+        """创建简单的数字模型"""
+        if self.num_slices is None:
+            shapes = self.phantom_shapes
+            if shapes is None:
+                shapes = self._default_phantom_shapes()
+            self.phantom[...] = rasterize_shapes(self.phantom.shape, shapes, dtype=self.phantom.dtype)
+            return
+        
+        # 三维模式: 内置模型按椭球逐层缩放, 自定义形状沿层方向拉伸
+        slice_shape = self.phantom.shape[1:]
+        half_depth = self.num_slices / 2
+        for z in range(self.num_slices):
+            shapes = self.phantom_shapes
+            if shapes is None:
+                dz = (z - (self.num_slices - 1) / 2) / half_depth
+                shapes = self._default_phantom_shapes(scale=np.sqrt(max(0.0, 1 - dz**2)))
+            self.phantom[z] = rasterize_shapes(slice_shape, shapes, dtype=self.phantom.dtype)
+    
+    @property
+    def tissue_params(self):
+        """组织参数 {名称: [T1(ms), T2*(ms), 质子密度]}, 由组织库生成的只读视图"""
+        arrays = (a.tolist() for a in self._tissue_param_arrays())
+        return {name: [t1, t2, pd] for name, t1, t2, pd in zip(self.tissues.names, *arrays)}
+    
+    def _tissue_to_params(self):
+        """组织类型标签映射到参数"""
+        return dict(enumerate(zip(*(a.tolist() for a in self._tissue_param_arrays()))))
+    
+    def _tissue_param_arrays(self):
+        """按标签顺序返回信号方程使用的 (T1, T2或T2*, PD) 参数数组"""
+        return self.tissues.t1, getattr(self.tissues, self.transverse_relaxation), self.tissues.pd
+    
+    def _equation_kwargs(self):
+        """信号方程除 TE/TR/翻转角 之外的额外序列参数"""
+        return {}
+    
+    def _sequence_key(self):
+        """标识当前序列及其参数, 用作缓存键"""
+        return (type(self).__name__, self.te, self.tr, self.flip_angle) + tuple(sorted(self._equation_kwargs().items()))
+    
+    def _tissue_signal_table(self):
+        """
+        按组织标签计算稳态信号查找表
+        
+        整张表由一次向量化信号方程调用得到, 耗时与组织数基本无关; 按组织库内容与序列参数缓存
+        """
+        key = (self.tissues.fingerprint(),) + self._sequence_key()
+        return self.tissue_cache.get(key, lambda: self.signal_equation(
+            *self._tissue_param_arrays(), self.te, self.tr, self.flip_angle,
+            **self._equation_kwargs()).astype(complex))
+    
+    def _image_key(self, *params):
+        """整幅图像缓存的键: 模型内容哈希 + 组织参数 + 序列参数"""
+        phantom_hash = hashlib.blake2b(np.ascontiguousarray(self.phantom).data, digest_size=16).hexdigest()
+        return (phantom_hash, self.phantom.shape, self.tissues.fingerprint()) + params
+    
+    def _require_signal(self):
+        """返回当前信号; 三维模式下信号在首次仿真时才分配, 之前调用依赖信号的方法会给出明确错误"""
+        if self.signal is None:
+            raise RuntimeError("尚未生成信号: 三维模式下请先调用 simulate_gre() 或 simulate()")
+        return self.signal
+    
+    def cache_info(self):
+        """返回组织信号表缓存与整幅图像缓存的命中统计"""
+        return {'tissue': self.tissue_cache.info(), 'image': self.image_cache.info()}
+    
+    def simulate(self):
+        """按当前序列仿真信号并返回信号幅值, 各序列子类共用此入口"""
+        return self.simulate_gre()
+    
+    def simulate_gre(self, vectorized=True):
+        """
+        模拟GRE序列并生成信号
+        
+        参数:
+            vectorized: 为True时使用查找表向量化计算; 为False时使用原始逐像素循环(用于回归对比)
+        """
+        if not vectorized:
+            if self.num_slices is not None:
+                raise ValueError("逐像素循环只支持二维模型, 三维模式请使用 vectorized=True")
+            return self._simulate_gre_loop()
+        
+        if self.signal is None:
+            self.signal = self._allocate('signal', self.phantom.shape, self.signal_dtype)
+        if self.storage_dir is None and self.num_slices is None:
+            # 内存中的二维仿真可直接复用缓存的整幅图像; 三维体数据不进缓存
+            key = self._image_key(*self._sequence_key())
+            self.signal[...] = self.image_cache.get(key, lambda: self._tissue_signal_table()[self.phantom.astype(np.intp)])
+            return np.abs(self.signal)
+        
+        # 每种组织只计算一次信号, 再通过标签图一次性散射到整幅图像
+        table = self._tissue_signal_table()
+        if self.num_slices is None:
+            self.signal[...] = table[self.phantom.astype(np.intp)]
+        else:
+            # 三维模式逐层写入, 避免整卷大小的临时数组
+            for z in range(self.num_slices):
+                self.signal[z] = table[self.phantom[z].astype(np.intp)]
+        if isinstance(self.signal, np.memmap):
+            self.signal.flush()
+        
+        return np.abs(self.signal)  # 返回信号幅值
+    
+    def simulate_parametric_maps(self, maps, out=None, chunk_size=2**20):
+        """
+        以连续的逐体素 T1/T2/PD 参数图作为输入仿真GRE信号, 分块向量化计算
+        
+        参数图以引用方式使用(可以是内存映射), 每次只把一块体素转换为浮点数参与计算;
+        各参数图须同为C连续或同为Fortran连续, 按该内存顺序分块, 不会复制整幅参数图
+        
+        参数:
+            maps: load_parametric_maps 的结果, 或可传给它的路径/字典;
+                  需包含 t1, t2, pd, 可选 t2star(缺省时使用 t2)
+            out: 可选的输出复数数组(例如 open_memmap 打开的文件), 形状与内存布局与参数图相同
+            chunk_size: 每块体素数
+        
+        返回:
+            复数信号数组; 未给出 out 时按 storage_dir 设置在内存或内存映射文件中分配
+        """
+        if not isinstance(maps, dict) or any(isinstance(v, str) for v in maps.values()):
+            maps = load_parametric_maps(maps)
+        t1, pd = maps['t1'], maps['pd']
+        t2 = maps.get('t2star', maps['t2']) if self.transverse_relaxation == 't2star' else maps['t2']
+        arrays = [np.asarray(a) for a in (t1, t2, pd)]
+        if all(a.flags.c_contiguous for a in arrays):
+            order = 'C'
+        elif all(a.flags.f_contiguous for a in arrays):
+            order = 'F'
+        else:
+            raise ValueError("参数图必须同为C连续或同为Fortran连续")
+        if out is None:
+            out = self._allocate('parametric_signal', t1.shape, self.signal_dtype, fortran_order=order == 'F')
+        
+        if not (out.flags.c_contiguous if order == 'C' else out.flags.f_contiguous):
+            raise ValueError(f"输出数组的内存布局必须与参数图一致({order}连续)")
+        # 按内存顺序展平连续数组只得到视图, 不会复制
+        flat = [a.ravel(order=order) for a in arrays + [out]]
+        for start in range(0, flat[0].size, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            flat[3][chunk] = self.signal_equation(flat[0][chunk], flat[1][chunk], flat[2][chunk],
+                                                  self.te, self.tr, self.flip_angle, **self._equation_kwargs())
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
+    
+    def _simulate_gre_loop(self):
+        """逐像素循环的原始GRE实现, 保留用于回归对比"""
+        tissue_to_params = self._tissue_to_params()
         
         # 对每个像素计算信号
         for i in range(self.matrix_size):
@@ -118,22 +982,398 @@ class GRESimulation:
         
         return np.abs(self.signal)  # 返回信号幅值
     
-    def add_noise(self, snr=20):
-        """添加高斯噪声到信号"""
-        # 计算标准差
-        signal_power = np.mean(np.abs(self.signal)**2)
-        sigma = np.sqrt(signal_power / snr)
+    def iter_slices(self):
+        """
+        逐层仿真的生成器, 每次产出一层的复数信号, 不在 self.signal 中保存整卷结果
+        
+        产出:
+            (z, slice_signal): 层号与该层信号; 二维模式下只产出一层, 层号为0
+        """
+        table = self._tissue_signal_table()
+        labels = self.phantom if self.num_slices is not None else self.phantom[np.newaxis]
+        for z, slice_labels in enumerate(labels):
+            yield z, table[slice_labels.astype(np.intp)]
+    
+    def write_slices(self, path, dtype=complex):
+        """
+        将逐层仿真结果直接流式写入 .npy 文件, 内存中每次只保留一层
+        
+        参数:
+            path: 输出文件路径, 可用 np.load(path, mmap_mode='r') 读取
+            dtype: 保存的数据类型, 例如 np.complex64 可减半磁盘占用
+        """
+        num_slices = self.num_slices if self.num_slices is not None else 1
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                        shape=(num_slices, self.matrix_size, self.matrix_size))
+        for z, slice_signal in self.iter_slices():
+            out[z] = slice_signal
+            out.flush()
+        del out
+        return path
+    
+    def simulate_sweep(self, te=None, tr=None, flip=None):
+        """
+        在TE/TR/翻转角参数网格上批量仿真, 不修改对象状态
+        
+        参数:
+            te: 回波时间(ms), 标量或序列, 默认使用当前值
+            tr: 重复时间(ms), 标量或序列, 默认使用当前值
+            flip: 翻转角(度), 标量或序列, 默认使用当前值
+        
+        返回:
+            信号幅值数组, 形状为 (各序列参数长度..., 矩阵行, 矩阵列);
+            以标量给出的参数不占用维度
+        """
+        te = self.te if te is None else te
+        tr = self.tr if tr is None else tr
+        flip = self.flip_angle * 180 / np.pi if flip is None else flip
+        
+        # 序列参数各占一个维度, 标量参数不占维度; 参数扫描的结果可能很大, 不进入图像缓存
+        axes = [np.asarray(v, dtype=float) for v in (te, tr, flip)]
+        return self._compute_sweep(axes)
+    
+    def _compute_sweep(self, axes):
+        """在参数网格上计算信号幅值"""
+        grid_shape = tuple(len(a) for a in axes if a.ndim > 0)
+        grids = np.meshgrid(*[a.reshape(-1) for a in axes], indexing='ij')
+        te_g, tr_g, flip_g = (g.reshape(grid_shape + (1,)) for g in grids)
+        
+        # 先在参数网格上计算每种组织的信号表, 再一次性按标签图散射
+        t1, t2, pd = self._tissue_param_arrays()
+        table = self.signal_equation(t1, t2, pd, te_g, tr_g, flip_g * np.pi / 180, **self._equation_kwargs())
+        result = table[..., self.phantom.astype(np.intp)]
+        if np.iscomplexobj(result):
+            return np.abs(result)
+        return np.abs(result, out=result)
+    
+    def sweep_blocks(self, te, tr, flip, memory_budget=256 * 2**20, max_workers=None):
+        """
+        将 TE×TR×翻转角 参数网格按内存预算分块, 在多进程中并行仿真并按完成顺序流式返回
+        
+        参数:
+            te, tr, flip: 参数序列(ms, ms, 度)
+            memory_budget: 所有在途结果块(含调用方持有的上一块)允许占用的总字节数
+            max_workers: 进程数, 默认为CPU核数
+        
+        产出:
+            (index, block): index 为该块在完整 (TE, TR, 翻转角) 网格中的切片元组,
+            block 为形状 (块TE数, 块TR数, 块翻转角数, 矩阵行, 矩阵列) 的信号幅值
+        """
+        axes = [np.atleast_1d(np.asarray(v, dtype=float)) for v in (te, tr, flip)]
+        max_workers = max_workers or os.cpu_count() or 1
+        
+        # 每个在途块同时最多存在两份: 子进程中的结果数组与其序列化字节, 或主进程中接收的字节与反序列化后的数组;
+        # 另外调用方还持有上一次产出的块, 因此预算按 2×进程数+1 份块均分
+        image_bytes = self.phantom.size * np.dtype(float).itemsize
+        images_per_block = max(1, memory_budget // (image_bytes * (2 * max_workers + 1)))
+        block_sizes = []
+        remaining = images_per_block
+        for axis in reversed(axes):  # 优先在最内层(翻转角)维度上成块
+            size = int(min(len(axis), remaining))
+            block_sizes.insert(0, size)
+            remaining = max(1, remaining // size)
+        block_index = itertools.product(*[
+            [slice(start, min(start + size, len(axis))) for start in range(0, len(axis), size)]
+            for axis, size in zip(axes, block_sizes)
+        ])
+        
+        # 标签图放入共享内存, 子进程直接映射而不是每个任务都序列化一次
+        labels = self.phantom.astype(np.min_scalar_type(int(self.phantom.max())))
+        shm = shared_memory.SharedMemory(create=True, size=max(1, labels.nbytes))
+        try:
+            np.ndarray(labels.shape, dtype=labels.dtype, buffer=shm.buf)[...] = labels
+            tissue_arrays = self._tissue_param_arrays()
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                pending = {}
+                while True:
+                    # 同时在途的块不超过进程数, 保证内存不超过预算
+                    while len(pending) < max_workers:
+                        index = next(block_index, None)
+                        if index is None:
+                            break
+                        te_b, tr_b, flip_b = (axis[sl] for axis, sl in zip(axes, index))
+                        future = executor.submit(_sweep_block_worker, shm.name, labels.shape, labels.dtype,
+                                                 tissue_arrays, te_b, tr_b, flip_b,
+                                                 type(self).signal_equation, self._equation_kwargs())
+                        pending[future] = index
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+    
+    def simulate_bloch(self, num_trs=200, num_isochromats=100, off_resonance=None, **kwargs):
+        """
+        使用Bloch方程时间步进仿真当前序列, 可模拟趋近稳态的瞬态过程、扰相和偏共振
+        
+        参数:
+            num_trs: 仿真的TR个数
+            num_isochromats: 每个体素的自旋等色线数
+            off_resonance: 额外的偏共振频率图(Hz), 形状与模型相同, 与组织库中的偏共振相加
+            **kwargs: 传给 bloch_simulate 的其他参数(spoiler_cycles, rf_spoiling, dtype, chunk_size 等)
+        
+        返回:
+            形状为 (num_trs, *模型形状) 的复数回波信号
+        """
+        # Bloch仿真显式模拟体素内失相, 因此横向弛豫使用T2而不是T2*
+        labels = self.phantom.reshape(-1).astype(np.intp)
+        tissues = self.tissues
+        voxel_params = np.stack([tissues.t1[labels], tissues.t2[labels], tissues.pd[labels],
+                                 tissues.off_resonance[labels]], axis=1)
+        if off_resonance is not None:
+            voxel_params[:, 3] += np.asarray(off_resonance, dtype=float).reshape(-1)
+        
+        # 参数完全相同的体素演化完全相同, 只仿真每组唯一参数一次
+        unique_params, inverse = np.unique(voxel_params, axis=0, return_inverse=True)
+        signals = bloch_simulate(unique_params[:, 0], unique_params[:, 1], unique_params[:, 2],
+                                 self.te, self.tr, self.flip_angle, num_trs=num_trs,
+                                 num_isochromats=num_isochromats, off_resonance=unique_params[:, 3], **kwargs)
+        return signals[:, inverse.reshape(-1)].reshape((num_trs,) + self.phantom.shape)
+    
+    def optimize_protocol(self, tissue_pairs=(('gray_matter', 'white_matter'),), te_range=(2, 50),
+                          tr_range=(10, 3000), flip_range=(1, 90), efficiency=True, num_starts=64,
+                          iterations=300, learning_rate=0.05):
+        """
+        基于解析梯度优化 TE/TR/翻转角, 使所选组织对之间的对比噪声比(CNR)最大
         
-        # 添加复数噪声
-        noise_real = np.random.normal(0, sigma, self.signal.shape)
-        noise_imag = np.random.normal(0, sigma, self.signal.shape)
-        noise = noise_real + 1j * noise_imag
+        多个随机起点组成一批, 每次迭代一次性计算整批候选的信号与梯度(Adam梯度上升, 投影到参数范围内)
         
-        self.signal = self.signal + noise
+        参数:
+            tissue_pairs: 组织名称对列表, 目标为各对信号差的平方和开方
+            te_range, tr_range, flip_range: 参数范围(ms, ms, 度)
+            efficiency: 为True时优化单位扫描时间的CNR(除以 sqrt(TR)), 否则优化单次采集的CNR
+            num_starts: 随机起点数
+            iterations: 迭代次数
+            learning_rate: 归一化参数空间中的步长
+        
+        返回:
+            字典: te, tr, flip_angle(度) 与对应的目标值 cnr(以单位噪声标准差计)
+        """
+        # 解析梯度只针对GRE信号方程推导; 使用 gre_signal 的子类(如多回波GRE)同样适用
+        if type(self).signal_equation is not gre_signal:
+            raise TypeError(f"{type(self).__name__} 不使用GRE信号方程, 协议优化只支持GRE序列")
+        t1, t2, pd = self._tissue_param_arrays()
+        labels = np.array([[self.tissues.label(a), self.tissues.label(b)] for a, b in tissue_pairs])
+        # 形状 (1, 组织对, 2), 与候选维度广播
+        t1, t2, pd = (v[labels][None] for v in (t1, t2, pd))
+        
+        bounds = np.array([te_range, tr_range, np.deg2rad(flip_range)], dtype=float)
+        low, span = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+        rng = np.random.default_rng(self.seed_sequence.spawn(1)[0])
+        x = rng.random((num_starts, 3))  # 归一化到 [0, 1] 的参数
+        
+        def objective(x):
+            te, tr, flip = (low + x * span).T[..., None, None]
+            s, d_te, d_tr, d_flip = gre_signal_gradient(t1, t2, pd, te, tr, flip)
+            contrast = s[..., 0] - s[..., 1]
+            d_contrast = np.stack([d[..., 0] - d[..., 1] for d in (d_te, d_tr, d_flip)], axis=-1)
+            value = np.sqrt(np.sum(contrast**2, axis=1))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                grad = np.where(value[:, None] > 0, np.einsum('np,npk->nk', contrast, d_contrast)
+                                / value[:, None], 0.0)
+            if efficiency:
+                scale = 1 / np.sqrt(tr[:, 0, 0])
+                grad = grad * scale[:, None]
+                grad[:, 1] -= value * scale / (2 * tr[:, 0, 0])
+                value = value * scale
+            return value, grad * span  # 链式法则换算到归一化参数
+        
+        # Adam梯度上升
+        m = np.zeros_like(x)
+        v = np.zeros_like(x)
+        beta1, beta2 = 0.9, 0.999
+        for step in range(1, iterations + 1):
+            _, grad = objective(x)
+            m = beta1 * m + (1 - beta1) * grad
+            v = beta2 * v + (1 - beta2) * grad**2
+            update = (m / (1 - beta1**step)) / (np.sqrt(v / (1 - beta2**step)) + 1e-12)
+            x = np.clip(x + learning_rate * update, 0, 1)
+        
+        values, _ = objective(x)
+        best = low + x[np.argmax(values)] * span
+        return {'te': float(best[0]), 'tr': float(best[1]), 'flip_angle': float(np.rad2deg(best[2])),
+                'cnr': float(values.max())}
+    
+    def noise_sigma(self, snr):
+        """按当前信号功率与目标信噪比计算噪声标准差"""
+        signal = self._require_signal()
+        signal_power = np.vdot(signal, signal).real / signal.size
+        return np.sqrt(signal_power / snr)
+    
+    def spawn_rngs(self, n):
+        """从本对象的种子派生 n 个相互独立的随机数流, 用于多进程蒙特卡洛"""
+        return [np.random.default_rng(child) for child in self.seed_sequence.spawn(n)]
+    
+    def add_noise(self, snr=20, rng=None):
+        """
+        添加高斯噪声到信号
+        
+        参数:
+            snr: 信噪比(信号功率/噪声方差)
+            rng: 可选的 np.random.Generator, 默认使用本对象的随机数流
+        """
+        # 计算标准差
+        sigma = self.noise_sigma(snr)
+        
+        # 添加复数噪声, 精度与信号数组一致
+        rng = self.rng if rng is None else rng
+        self.signal += complex_noise(rng, self.signal.shape, sigma, dtype=self.signal.dtype)  # 原地相加, 保留内存映射后端
         return np.abs(self.signal)
     
+    def monte_carlo_snr(self, num_realisations=100, snr=20, max_workers=None):
+        """
+        蒙特卡洛信噪比研究: 对当前无噪声信号进行多次独立噪声实现, 流式累积逐像素统计量
+        
+        不修改 self.signal, 内存占用与实现次数无关
+        
+        参数:
+            num_realisations: 噪声实现次数
+            snr: 信噪比(信号功率/噪声方差)
+            max_workers: 工作进程数; 为None或1时在当前进程中运行
+        
+        返回:
+            字典, 包含逐像素的 mean(幅值均值)、variance(幅值方差)、
+            bias(幅值均值减去无噪声幅值, 即Rician偏差)、snr(均值/标准差) 以及 count
+        """
+        clean = np.array(self._require_signal())
+        sigma = self.noise_sigma(snr)
+        
+        # 每个工作单元使用独立的随机数子流, 相同种子与进程数下结果可复现
+        num_tasks = max_workers or 1
+        counts = [len(chunk) for chunk in np.array_split(np.arange(num_realisations), num_tasks)]
+        seeds = self.seed_sequence.spawn(num_tasks)
+        if num_tasks == 1:
+            partials = [_monte_carlo_worker(clean, sigma, counts[0], seeds[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                partials = list(executor.map(_monte_carlo_worker, [clean] * num_tasks, [sigma] * num_tasks,
+                                             counts, seeds))
+        
+        stats = RunningStats(clean.shape)
+        for partial in partials:
+            stats.merge(partial)
+        std = np.sqrt(stats.variance)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            snr_map = np.where(std > 0, stats.mean / std, 0.0)
+        return {
+            'mean': stats.mean,
+            'variance': stats.variance,
+            'bias': stats.mean - np.abs(clean),
+            'snr': snr_map,
+            'count': stats.count,
+        }
+    
+    def simulate_coils(self, num_coils=8, sensitivities=None):
+        """
+        用多通道线圈灵敏度调制当前信号, 所有线圈在一次广播运算中完成
+        
+        参数:
+            num_coils: 线圈通道数, 未给出 sensitivities 时使用
+            sensitivities: 可选的灵敏度图, 形状 (线圈, 行, 列)
+        
+        返回:
+            形状为 (线圈, *信号形状) 的多线圈复数图像
+        """
+        self._require_signal()
+        if sensitivities is None:
+            # 相同几何的灵敏度图只生成一次
+            cached = self.coil_sensitivities
+            if cached is not None and cached.shape == (num_coils,) + self.signal.shape[-2:]:
+                sensitivities = cached
+            else:
+                sensitivities = coil_sensitivity_maps(num_coils, self.signal.shape[-2:])
+        self.coil_sensitivities = sensitivities
+        # 三维模式下同一组灵敏度图作用于每一层
+        coil_axes = sensitivities.reshape(sensitivities.shape[:1] + (1,) * (self.signal.ndim - 2)
+                                          + sensitivities.shape[1:])
+        return coil_axes * self.signal
+    
+    def reconstruct_sense(self, coil_images, acceleration):
+        """
+        将多线圈图像按加速因子折叠(模拟欠采样混叠), 再用 SENSE 展开重建
+        
+        参数:
+            coil_images: simulate_coils 的输出(二维模式)
+            acceleration: 加速因子
+        """
+        aliased = fold_coil_images(coil_images, acceleration)
+        return sense_unfold(aliased, self.coil_sensitivities, acceleration)
+    
+    def acquire_kspace(self, partial_fourier=1.0, acceleration=1, center_lines=0):
+        """
+        对当前信号做笛卡尔逐行k空间采集, 未采集的相位编码行置零
+        
+        参数: 见 sampling_mask
+        
+        返回:
+            k空间数据, 形状与 self.signal 相同; 三维模式下所有层一次性批量变换
+        """
+        mask = sampling_mask(self._require_signal().shape[-2], partial_fourier, acceleration, center_lines)
+        self.kspace_mask = mask
+        self.kspace = fft2c(np.asarray(self.signal))
+        self.kspace[..., ~mask, :] = 0
+        return self.kspace
+    
+    def reconstruct(self, kspace=None):
+        """
+        零填充FFT重建, 对最后两维计算, 多层/多线圈数据一次批量完成
+        
+        参数:
+            kspace: k空间数据, 默认使用 acquire_kspace 的结果
+        
+        返回:
+            复数图像
+        """
+        if kspace is None:
+            if self.kspace is None:
+                raise RuntimeError("没有k空间数据: 请先调用 acquire_kspace() 或显式传入 kspace")
+            kspace = self.kspace
+        return ifft2c(kspace)
+    
+    def _export(self, out_dir, name, image, fmt, writer):
+        path = os.path.join(out_dir, f'{name}.{fmt}')
+        if writer is None:
+            write_image(path, image)
+        else:
+            writer.submit(path, image)
+        return path
+    
+    def export_results(self, out_dir, fmt='png', writer=None, snr=15):
+        """
+        无界面导出 plot_results 中的图像, 不构建matplotlib图表
+        
+        参数:
+            out_dir: 输出目录
+            fmt: 'png' 或 'npz'
+            writer: 可选的 ImageWriter, 提供时在后台线程中编码写盘
+            snr: 噪声图像的信噪比; 与 plot_results 相同, 会向 self.signal 添加噪声
+        
+        返回:
+            写出的文件路径列表
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        paths = [self._export(out_dir, 'phantom', self.phantom, fmt, writer),
+                 self._export(out_dir, 'signal', np.abs(self.signal), fmt, writer)]
+        paths.append(self._export(out_dir, f'noisy_snr{snr}', self.add_noise(snr=snr), fmt, writer))
+        return paths
+    
+    def export_parameter_effects(self, out_dir, fmt='png', writer=None):
+        """无界面导出 simulate_parameter_effects 中的九幅图像"""
+        os.makedirs(out_dir, exist_ok=True)
+        sweeps = {'te': [5, 20, 50], 'tr': [50, 500, 2000], 'flip': [5, 30, 90]}
+        paths = []
+        for name, values in sweeps.items():
+            signals = self.simulate_sweep(**{name: values})
+            for value, signal in zip(values, signals):
+                paths.append(self._export(out_dir, f'{name}_{value}', signal, fmt, writer))
+        return paths
+    
     def plot_results(self):
         """绘制仿真结果"""
+        plt = _pyplot()
         fig, axes = plt.subplots(1, 3, figsize=(15, 5))
         
         # 绘制数字模型
@@ -156,11 +1396,11 @@ class GRESimulation:
         # 添加参数信息
         param_text = f"FOV: {self.fov}mm\nMatrix: {self.matrix_size}×{self.matrix_size}\n"
         param_text += f"像素大小: {self.pixel_size:.2f}mm\n"
-        param_text += "组织参数 [T1, T2, PD]:\n"
-        param_text += f"CSF: {self.tissue_params['csf']}\n"
-        param_text += f"灰质: {self.tissue_params['gray_matter']}\n"
-        param_text += f"白质: {self.tissue_params['white_matter']}\n"
-        param_text += f"肌肉: {self.tissue_params['muscle']}"
+        param_text += "组织参数 [T1, T2, PD]:"
+        display_names = {'csf': 'CSF', 'gray_matter': '灰质', 'white_matter': '白质', 'muscle': '肌肉'}
+        shown = [(name, params) for name, params in self.tissue_params.items() if params[2] > 0]
+        for name, params in shown[:8]:  # 组织很多时只列出前几种
+            param_text += f"\n{display_names.get(name, name)}: {params}"
         
         plt.figtext(0.01, 0.02, param_text, fontsize=9, bbox=dict(facecolor='white', alpha=0.8))
         
@@ -169,56 +1409,36 @@ class GRESimulation:
     
     def simulate_parameter_effects(self):
         """模拟不同参数对GRE信号的影响"""
-        # 保存原始参数
-        orig_te = self.te
-        orig_tr = self.tr
-        orig_flip = self.flip_angle
-        
+        plt = _pyplot()
         # 创建图表
         fig, axes = plt.subplots(3, 3, figsize=(15, 15))
         
-        # 测试不同的TE值
+        # 每一行只改变一个参数, 其余参数保持当前值; 批量仿真不修改对象状态
         te_values = [5, 20, 50]
-        for i, te in enumerate(te_values):
-            self.te = te
-            signal = self.simulate_gre()
-            axes[0, i].imshow(signal, cmap='gray')
-            axes[0, i].set_title(f'TE = {te}ms')
-            if i == 0:
-                axes[0, i].set_ylabel('变化TE')
-        
-        # 测试不同的TR值
-        self.te = orig_te
         tr_values = [50, 500, 2000]
-        for i, tr in enumerate(tr_values):
-            self.tr = tr
-            signal = self.simulate_gre()
-            axes[1, i].imshow(signal, cmap='gray')
-            axes[1, i].set_title(f'TR = {tr}ms')
-            if i == 0:
-                axes[1, i].set_ylabel('变化TR')
-        
-        # 测试不同的翻转角
-        self.tr = orig_tr
         flip_values = [5, 30, 90]
-        for i, flip in enumerate(flip_values):
-            self.flip_angle = flip * np.pi / 180
-            signal = self.simulate_gre()
-            axes[2, i].imshow(signal, cmap='gray')
-            axes[2, i].set_title(f'翻转角 = {flip}°')
-            if i == 0:
-                axes[2, i].set_ylabel('变化翻转角')
-        
-        # 恢复原始参数
-        self.te = orig_te
-        self.tr = orig_tr
-        self.flip_angle = orig_flip
+        rows = [
+            (self.simulate_sweep(te=te_values), [f'TE = {te}ms' for te in te_values], '变化TE'),
+            (self.simulate_sweep(tr=tr_values), [f'TR = {tr}ms' for tr in tr_values], '变化TR'),
+            (self.simulate_sweep(flip=flip_values), [f'翻转角 = {flip}°' for flip in flip_values], '变化翻转角'),
+        ]
+        
+        for row, (signals, titles, ylabel) in enumerate(rows):
+            for i, (signal, title) in enumerate(zip(signals, titles)):
+                axes[row, i].imshow(signal, cmap='gray')
+                axes[row, i].set_title(title)
+                if i == 0:
+                    axes[row, i].set_ylabel(ylabel)
         
         plt.tight_layout()
         return fig
 
 # 运行仿真示例
-def run_simulation():
+def run_simulation(output_dir=None):
+    """
+    参数:
+        output_dir: 若给定, 以无界面方式将图像导出到该目录, 不打开窗口
+    """
     # 创建仿真对象，使用自定义参数
     sim = GRESimulation(
         fov=240,           # 成像视野 (mm)
@@ -231,13 +1451,19 @@ def run_simulation():
     # 执行GRE仿真
     sim.simulate_gre()
     
+    if output_dir is not None:
+        with ImageWriter() as writer:
+            sim.export_parameter_effects(output_dir, writer=writer)
+            sim.export_results(output_dir, writer=writer)
+        return
+    
     # 绘制结果
     fig1 = sim.plot_results()
     
     # 模拟不同参数的效果
     fig2 = sim.simulate_parameter_effects()
     
-    plt.show()
+    _pyplot().show()
 
 if __name__ == "__main__":
     run_simulation()
\ No newline at end of file
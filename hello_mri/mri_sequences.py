@@ -0,0 +1,112 @@
+"""在 GRESimulation 的模型与组织库基础上实现的其他序列: 自旋回波、反转恢复、bSSFP 与多回波GRE"""
+import numpy as np
+
+from mri_gre import GRESimulation, gre_signal
+
+def _decay(t, tau):
+    """弛豫因子 exp(-t/tau); tau 为0(空气)时为0"""
+    tau = np.asarray(tau, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(tau > 0, np.exp(-t / tau), 0.0)
+
+def se_signal(t1, t2, pd, te, tr, flip_angle=np.pi / 2):
+    """自旋回波信号方程: S = PD * (1 - exp(-TR/T1)) * exp(-TE/T2), 翻转角固定为90°"""
+    return np.asarray(pd, dtype=float) * (1 - _decay(tr, t1)) * _decay(te, t2)
+
+def ir_signal(t1, t2, pd, te, tr, flip_angle=np.pi / 2, ti=500):
+    """反转恢复信号方程: S = PD * (1 - 2exp(-TI/T1) + exp(-TR/T1)) * exp(-TE/T2), 保留符号"""
+    return np.asarray(pd, dtype=float) * (1 - 2 * _decay(ti, t1) + _decay(tr, t1)) * _decay(te, t2)
+
+def bssfp_signal(t1, t2, pd, te, tr, flip_angle):
+    """共振频率处的平衡稳态自由进动(bSSFP)信号方程"""
+    e1, e2 = _decay(tr, t1), _decay(tr, t2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m_xy = (np.asarray(pd, dtype=float) * np.sin(flip_angle) * (1 - e1)
+                / (1 - (e1 - e2) * np.cos(flip_angle) - e1 * e2) * _decay(te, t2))
+    return np.where(np.asarray(pd) == 0, 0.0, m_xy)
+
+class SequenceSimulation(GRESimulation):
+    """其他序列的公共基类: 信号查找表与逐像素参考路径都由 signal_equation 计算, 其余流程与 GRESimulation 共用"""
+    
+    transverse_relaxation = 't2'
+    
+    def _tissue_signal(self, t1, t2, pd):
+        """单个组织在当前序列参数下的信号"""
+        return complex(self.signal_equation(t1, t2, pd, self.te, self.tr, self.flip_angle, **self._equation_kwargs()))
+    
+    def _simulate_gre_loop(self):
+        """逐像素循环的参考实现: 每个像素单独调用 _tissue_signal, 用于与向量化结果回归对比"""
+        tissue_to_params = self._tissue_to_params()
+        for i in range(self.matrix_size):
+            for j in range(self.matrix_size):
+                self.signal[i, j] = self._tissue_signal(*tissue_to_params[int(self.phantom[i, j])])
+        return np.abs(self.signal)
+
+class SpinEchoSimulation(SequenceSimulation):
+    """自旋回波(SE)序列仿真"""
+    
+    signal_equation = staticmethod(se_signal)
+    
+    def __init__(self, te=15, tr=500, **kwargs):
+        kwargs.setdefault('flip_angle', 90)
+        super().__init__(te=te, tr=tr, **kwargs)
+
+class InversionRecoverySimulation(SequenceSimulation):
+    """反转恢复(IR)序列仿真"""
+    
+    signal_equation = staticmethod(ir_signal)
+    
+    def __init__(self, te=15, tr=3000, ti=500, **kwargs):
+        """
+        参数:
+            ti: 反转时间(ms)
+            其余参数同 GRESimulation
+        """
+        self.ti = ti
+        kwargs.setdefault('flip_angle', 90)
+        super().__init__(te=te, tr=tr, **kwargs)
+    
+    def _equation_kwargs(self):
+        return {'ti': self.ti}
+
+class BSSFPSimulation(SequenceSimulation):
+    """平衡稳态自由进动(bSSFP)序列仿真, 默认 TE = TR/2"""
+    
+    signal_equation = staticmethod(bssfp_signal)
+    
+    def __init__(self, tr=5, te=None, flip_angle=50, **kwargs):
+        super().__init__(te=tr / 2 if te is None else te, tr=tr, flip_angle=flip_angle, **kwargs)
+
+class MultiEchoGRESimulation(SequenceSimulation):
+    """多回波GRE序列仿真: 一次计算返回所有回波, 而不是逐个TE重新仿真"""
+    
+    signal_equation = staticmethod(gre_signal)
+    transverse_relaxation = 't2star'
+    
+    def __init__(self, echo_times=(5, 10, 20, 40), **kwargs):
+        """
+        参数:
+            echo_times: 各回波的回波时间(ms)
+            其余参数同 GRESimulation; self.te 为第一个回波时间
+        """
+        self.echo_times = np.asarray(echo_times, dtype=float)
+        self.echo_signals = None
+        super().__init__(te=self.echo_times[0], **kwargs)
+    
+    def _sequence_key(self):
+        return super()._sequence_key() + (tuple(self.echo_times),)
+    
+    def simulate(self):
+        """
+        一次计算所有回波: 先在 (回波, 组织) 上计算信号表, 再按标签图一次性散射
+        
+        返回:
+            形状为 (回波数, *模型形状) 的信号幅值; self.signal 保存第一个回波
+        """
+        t1, t2, pd = self._tissue_param_arrays()
+        table = self.signal_equation(t1, t2, pd, self.echo_times[:, None], self.tr, self.flip_angle)
+        self.echo_signals = table[:, self.phantom.astype(np.intp)]
+        if self.signal is None:
+            self.signal = self._allocate('signal', self.phantom.shape, self.signal_dtype)
+        self.signal[...] = self.echo_signals[0]
+        return np.abs(self.echo_signals)
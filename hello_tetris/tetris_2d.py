@@ -3,6 +3,8 @@ import random
 import numpy
 import math
 import asyncio  # 添加asyncio支持
+from tetris_engine import TetrisGame
+from tetris_ai import AutoPlayer
 
 # 游戏常量
 SCREEN_WIDTH = 400  # 增加宽度以容纳预览区域
@@ -10,6 +12,8 @@ SCREEN_HEIGHT = 600
 BLOCK_SIZE = 30
 FPS = 30
 INITIAL_DROP_INTERVAL = 0.5  # 初始下落间隔时间（秒）
+GRID_WIDTH = SCREEN_WIDTH // BLOCK_SIZE
+GRID_HEIGHT = SCREEN_HEIGHT // BLOCK_SIZE
 COLORS = {
     'background': (15, 56, 15),
     'grid': (48, 98, 48),
@@ -22,65 +26,63 @@ COLORS = {
     'L': (227, 91, 2)
 }
 
-# 方块形状
-SHAPES = {
-    'I': [[1, 1, 1, 1]],
-    'O': [[1, 1],
-          [1, 1]],
-    'T': [[0, 1, 0],
-          [1, 1, 1]],
-    'S': [[0, 1, 1],
-          [1, 1, 0]],
-    'Z': [[1, 1, 0],
-          [0, 1, 1]],
-    'J': [[1, 0, 0],
-          [1, 1, 1]],
-    'L': [[0, 0, 1],
-          [1, 1, 1]]
-}
-
-class Tetris:
+class Tetris(TetrisGame):
     def __init__(self):
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption('Retro Tetris')
         self.clock = pygame.time.Clock()
-        self.grid = [[0] * (SCREEN_WIDTH // BLOCK_SIZE) 
-                    for _ in range(SCREEN_HEIGHT // BLOCK_SIZE)]
-        self.current_piece = self.new_piece()
-        self.next_piece = self.new_piece()
-        self.score = 0
-        self.game_over = False
-        self.last_drop_time = pygame.time.get_ticks()
-        self.drop_interval = INITIAL_DROP_INTERVAL * 1000  # 转换为毫秒
+        self.fonts = {}
+        # 背景与网格线不会变化, 预先绘制一次, 之后只从中拷贝需要重绘的区域
+        self.background = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+        self.background.fill(COLORS['background'])
+        self.draw_grid_lines(self.background)
+        # 游戏规则由纯逻辑的 TetrisGame 实现, 这里只注入pygame时钟并负责绘制与输入
+        super().__init__(GRID_WIDTH, GRID_HEIGHT,
+                         drop_interval=INITIAL_DROP_INTERVAL * 1000,  # 转换为毫秒
+                         get_ticks=pygame.time.get_ticks, rng=random, colors=COLORS)
+        self.auto_player = None  # 按A键开关自动游玩
+        self.auto_actions = []
 
-    def new_piece(self):
-        shape = random.choice(list(SHAPES.keys()))
-        return {
-            'shape': shape,
-            'rotation': 0,
-            'x': SCREEN_WIDTH // BLOCK_SIZE // 2 - 1,
-            'y': 0,
-            'color': COLORS[shape]
-        }
+    def reset(self):
+        super().reset()
+        self.drawn_cells = None  # 下一帧整屏重绘
+        self.drawn_hud = None
+        self.hud_rects = []
 
-    def draw_grid(self):
-        for y, row in enumerate(self.grid):
-            for x, val in enumerate(row):
-                if val:
-                    pygame.draw.rect(self.screen, val,
-                                   (x * BLOCK_SIZE, y * BLOCK_SIZE,
-                                    BLOCK_SIZE, BLOCK_SIZE))
+    def font(self, size):
+        if size not in self.fonts:
+            self.fonts[size] = pygame.font.SysFont('8bitoperator', size)
+        return self.fonts[size]
 
-    def draw_piece(self, piece):
-        shape = SHAPES[piece['shape']]
-        for y, row in enumerate(shape):
-            for x, val in enumerate(row):
-                if val:
-                    pygame.draw.rect(self.screen, piece['color'],
-                                   ((piece['x'] + x) * BLOCK_SIZE,
-                                    (piece['y'] + y) * BLOCK_SIZE,
-                                    BLOCK_SIZE, BLOCK_SIZE))
+    def toggle_auto_play(self):
+        if self.auto_player is None:
+            # 在当前进程内搜索: 单次搜索只需几毫秒, 浏览器(pygbag)中也没有多进程
+            self.auto_player = AutoPlayer(GRID_WIDTH)
+        else:
+            self.auto_player.close()
+            self.auto_player = None
+        self.auto_actions = []
+
+    def auto_play(self):
+        """自动游玩: 每个新方块出现时搜索一次落点, 之后每帧执行一个动作"""
+        if self.auto_player is None:
+            return
+        if not self.auto_actions:
+            self.auto_actions = self.auto_player.plan(self)
+            self.auto_piece = self.pieces
+        elif self.auto_piece != self.pieces:  # 方块已被重力固定, 丢弃剩余动作
+            self.auto_actions = []
+            return
+        action = self.auto_actions.pop(0)
+        if not self.apply_action(action):
+            # 方块在执行途中被重力移动后动作被挡住: 下一帧从当前位置重新规划
+            self.auto_actions = []
+            return
+        if action == 'drop':
+            # 立即固定, 避免在等待下一次下落时对同一方块重新规划
+            self.gravity()
+            self.last_drop_time = self.get_ticks()
 
     def handle_events(self):
         for event in pygame.event.get():
@@ -102,88 +104,76 @@ class Tetris:
                 elif event.key == pygame.K_SPACE:
                     self.hard_drop()
                     self.play_sound('drop')
+                elif event.key == pygame.K_a:
+                    self.toggle_auto_play()
 
-    def move_piece(self, dx=0, dy=0):
-        new_x = self.current_piece['x'] + dx
-        new_y = self.current_piece['y'] + dy
-        if not self.check_collision(new_x, new_y):
-            self.current_piece['x'] = new_x
-            self.current_piece['y'] = new_y
-            return True
-        return False
-
-    def rotate_piece(self):
-        shape = SHAPES[self.current_piece['shape']]
-        rotated = list(zip(*shape[::-1]))
-        if not self.check_collision(self.current_piece['x'], 
-                                  self.current_piece['y'], rotated):
-            SHAPES[self.current_piece['shape']] = rotated
-
-    def hard_drop(self):
-        while self.move_piece(0, 1):
-            pass
-
-    def check_collision(self, x, y, shape=None):
-        shape = shape or SHAPES[self.current_piece['shape']]
-        for row_idx, row in enumerate(shape):
-            for col_idx, cell in enumerate(row):
-                if cell:
-                    grid_x = x + col_idx
-                    grid_y = y + row_idx
-                    if (grid_x < 0 or grid_x >= len(self.grid[0]) or
-                        grid_y >= len(self.grid) or
-                        (grid_y >= 0 and self.grid[grid_y][grid_x])):
-                        return True
-        return False
+    def frame_cells(self):
+        """当前画面中所有有颜色的格子: (x, y) -> 颜色, 包括已固定的方块和当前方块"""
+        cells = {(x, y): val for y, row in enumerate(self.grid) for x, val in enumerate(row) if val}
+        piece = self.current_piece
+        for y, row in enumerate(self.piece_rotation(piece).shape):
+            for x, val in enumerate(row):
+                if val and piece['y'] + y >= 0:
+                    cells[piece['x'] + x, piece['y'] + y] = piece['color']
+        return cells
 
-    def update(self):
-        current_time = pygame.time.get_ticks()
-        if current_time - self.last_drop_time > self.drop_interval:
-            if not self.move_piece(0, 1):
-                self.lock_piece()
-                self.clear_lines()
-                self.current_piece = self.next_piece
-                self.next_piece = self.new_piece()
-                if self.check_collision(self.current_piece['x'],
-                                      self.current_piece['y']):
-                    self.game_over = True
-            self.last_drop_time = current_time
+    def hud_state(self):
+        """决定预览区、分数和结束提示外观的状态, 变化时才需要重绘这些区域"""
+        return (self.score, self.game_over, self.next_piece['shape'],
+                self.current_piece['shape'], self.current_piece['rotation'])
 
-    def lock_piece(self):
-        shape = SHAPES[self.current_piece['shape']]
-        for y, row in enumerate(shape):
-            for x, cell in enumerate(row):
-                if cell:
-                    grid_x = self.current_piece['x'] + x
-                    grid_y = self.current_piece['y'] + y
-                    self.grid[grid_y][grid_x] = self.current_piece['color']
+    def draw_cell(self, x, y, color):
+        """用背景覆盖一个格子后按需填充颜色, 返回格子区域"""
+        rect = pygame.Rect(x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+        self.screen.blit(self.background, rect, rect)
+        if color:
+            pygame.draw.rect(self.screen, color, rect)
+        return rect
 
-    def clear_lines(self):
-        lines_cleared = 0
-        for y in range(len(self.grid)):
-            if all(self.grid[y]):
-                del self.grid[y]
-                self.grid.insert(0, [0] * (SCREEN_WIDTH // BLOCK_SIZE))
-                lines_cleared += 1
-        self.score += lines_cleared * 100
+    def draw_hud(self):
+        """绘制预览区、分数和结束提示, 返回它们占据的区域列表"""
+        rects = self.draw_next_piece() + [self.draw_score()]
+        if self.game_over:
+            rects.append(self.draw_game_over())
+        return rects
 
     def render(self):
-        self.screen.fill(COLORS['background'])
-        self.draw_grid_lines()
-        self.draw_grid()
-        self.draw_piece(self.current_piece)
-        self.draw_next_piece()
-        self.draw_score()
-        if self.game_over:
-            self.draw_game_over()
-        pygame.display.flip()
+        """只重绘与上一帧不同的格子; 覆盖在棋盘上的预览区与分数随之重绘, 仅更新变化的矩形"""
+        cells = self.frame_cells()
+        hud = self.hud_state()
+        if self.drawn_cells is None:
+            self.screen.blit(self.background, (0, 0))
+            for (x, y), color in cells.items():
+                self.draw_cell(x, y, color)
+            self.hud_rects = self.draw_hud()
+            pygame.display.flip()
+        else:
+            changed = [key for key in cells.keys() | self.drawn_cells.keys()
+                       if cells.get(key) != self.drawn_cells.get(key)]
+            dirty = [self.draw_cell(x, y, cells.get((x, y))) for x, y in changed]
+            if hud != self.drawn_hud or any(rect.collidelist(self.hud_rects) != -1 for rect in dirty):
+                # 预览区与分数覆盖在棋盘上: 先恢复它们下面的背景与格子, 再画在最上层
+                for rect in self.hud_rects:
+                    self.screen.blit(self.background, rect, rect)
+                    for (x, y), color in cells.items():
+                        cell = pygame.Rect(x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+                        if cell.colliderect(rect):
+                            pygame.draw.rect(self.screen, color, cell.clip(rect))
+                dirty += self.hud_rects
+                self.hud_rects = self.draw_hud()
+                dirty += self.hud_rects
+            if dirty:
+                pygame.display.update(dirty)
+        self.drawn_cells = cells
+        self.drawn_hud = hud
 
-    def draw_grid_lines(self):
+    def draw_grid_lines(self, surface=None):
+        surface = surface or self.screen
         for x in range(0, SCREEN_WIDTH, BLOCK_SIZE):
-            pygame.draw.line(self.screen, COLORS['grid'],
+            pygame.draw.line(surface, COLORS['grid'],
                             (x, 0), (x, SCREEN_HEIGHT), 1)
         for y in range(0, SCREEN_HEIGHT, BLOCK_SIZE):
-            pygame.draw.line(self.screen, COLORS['grid'],
+            pygame.draw.line(surface, COLORS['grid'],
                             (0, y), (SCREEN_WIDTH, y), 1)
 
     def draw_next_piece(self):
@@ -193,12 +183,12 @@ class Tetris:
         preview_width = 100
         
         # 绘制"Next"标签
-        font = pygame.font.SysFont('8bitoperator', 18)
+        font = self.font(18)
         label = font.render('Next:', True, (255, 255, 255))
-        self.screen.blit(label, (preview_x, 10))
+        rects = [self.screen.blit(label, (preview_x, 10))]
         
         # 绘制预览方块
-        shape = SHAPES[self.next_piece['shape']]
+        shape = self.piece_rotation(self.next_piece).shape
         preview_block_size = BLOCK_SIZE // 2
         start_x = preview_x + (preview_width - len(shape[0]) * preview_block_size) // 2
         start_y = 40
@@ -206,32 +196,32 @@ class Tetris:
         for y, row in enumerate(shape):
             for x, cell in enumerate(row):
                 if cell:
-                    pygame.draw.rect(self.screen, self.next_piece['color'],
+                    rects.append(pygame.draw.rect(self.screen, self.next_piece['color'],
                                    (start_x + x * preview_block_size,
                                     start_y + y * preview_block_size,
-                                    preview_block_size, preview_block_size))
+                                    preview_block_size, preview_block_size)))
         
         # 绘制当前方块
         current_label = font.render('Current:', True, (255, 255, 255))
-        self.screen.blit(current_label, (preview_x, 150))
+        rects.append(self.screen.blit(current_label, (preview_x, 150)))
         
-        current_shape = SHAPES[self.current_piece['shape']]
+        current_shape = self.piece_rotation(self.current_piece).shape
         current_start_x = preview_x + (preview_width - len(current_shape[0]) * preview_block_size) // 2
         current_start_y = 180
         
         for y, row in enumerate(current_shape):
             for x, cell in enumerate(row):
                 if cell:
-                    pygame.draw.rect(self.screen, self.current_piece['color'],
+                    rects.append(pygame.draw.rect(self.screen, self.current_piece['color'],
                                    (current_start_x + x * preview_block_size,
                                     current_start_y + y * preview_block_size,
-                                    preview_block_size, preview_block_size))
+                                    preview_block_size, preview_block_size)))
+        return rects
 
     def draw_game_over(self):
-        font = pygame.font.SysFont('8bitoperator', 36)
-        text = font.render('GAME OVER', True, (255, 0, 0))
+        text = self.font(36).render('GAME OVER', True, (255, 0, 0))
         text_rect = text.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2))
-        self.screen.blit(text, text_rect)
+        return self.screen.blit(text, text_rect)
 
     def play_sound(self, sound):
         if hasattr(self, 'sounds'):
@@ -265,9 +255,8 @@ class Tetris:
         }
 
     def draw_score(self):
-        font = pygame.font.SysFont('8bitoperator', 24)
-        text = font.render(f'Score: {self.score}', True, (255, 255, 255))
-        self.screen.blit(text, (10, 10))
+        text = self.font(24).render(f'Score: {self.score}', True, (255, 255, 255))
+        return self.screen.blit(text, (10, 10))
 
     def run(self):
         pygame.mixer.init()
@@ -276,6 +265,7 @@ class Tetris:
             while not self.game_over:
                 self.clock.tick(FPS)
                 self.handle_events()
+                self.auto_play()
                 self.update()
                 self.render()
             
@@ -287,11 +277,13 @@ class Tetris:
             while True:
                 event = pygame.event.wait()
                 if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    if self.auto_player is not None:
+                        self.auto_player.close()
                     pygame.quit()
                     return
                 elif event.type == pygame.KEYDOWN:
                     # 按任意键重新开始
-                    self.__init__()
+                    self.reset()
                     break
 
 if __name__ == '__main__':
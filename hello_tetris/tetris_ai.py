@@ -0,0 +1,297 @@
+"""俄罗斯方块自动玩家: 枚举当前方块与下一个方块的所有 (旋转, 列) 落点, 用启发式评分选出最佳落点
+
+棋盘以 Board.rows 的整数位掩码列表表示, 落点模拟、消行与特征计算都用位运算完成;
+只考虑按 "原地顺时针旋转 → 同一行平移 → 快速下落" 能够真正到达的落点
+"""
+import operator
+import time
+
+from tetris_engine import ROTATIONS, build_placements, rows_collide
+
+# 启发式权重: 总高度、消行数、空洞数、相邻列高度差之和
+WEIGHTS = {
+    'aggregate_height': -0.510066,
+    'lines': 0.760666,
+    'holes': -0.35663,
+    'bumpiness': -0.184483,
+}
+
+# 每个旋转状态对应落点表中形状相同的第一个旋转序号(见 build_placements)
+CANONICAL = {name: [next(i for i, other in enumerate(states) if other.shape == state.shape) for state in states]
+             for name, states in ROTATIONS.items()}
+
+# 任何方块的旋转状态最多占4行
+PIECE_ROWS = 4
+
+def _top_row(rows):
+    """最上方非空行的行号, 空棋盘返回行数"""
+    for y, row in enumerate(rows):
+        if row:
+            return y
+    return len(rows)
+
+def column_tops(rows, width):
+    """每列最上方方块的行号, 空列为棋盘高度"""
+    height = len(rows)
+    tops = [height] * width
+    full_row = (1 << width) - 1
+    covered = 0
+    for y in range(_top_row(rows), height):
+        top = rows[y] & ~covered
+        while top:
+            bit = top & -top
+            tops[bit.bit_length() - 1] = y
+            top ^= bit
+        covered |= rows[y]
+        if covered == full_row:
+            break
+    return tops
+
+def reachable_placements(rows, width, shape, x, y, rotation):
+    """
+    从 (x, y, rotation) 出发, 先原地顺时针旋转若干次、再在同一行左右平移能到达的落点
+
+    与 TetrisGame.rotate_piece/move_piece 使用同样的碰撞判断, 中途被挡住的旋转或平移视为不可达
+
+    返回:
+        None 表示方块所在的几行为空且各旋转状态都不碰墙, 所有落点都可到达;
+        否则为 {(落点表中的旋转序号, x): 实际需要转到的旋转序号}
+    """
+    if (y + PIECE_ROWS <= len(rows) and not any(rows[max(y, 0):y + PIECE_ROWS])
+            and all(-state.min_col <= x < width - state.max_col for state in ROTATIONS[shape])):
+        return None
+    reach = {}
+    for turns in range(4):
+        index = (rotation + turns) % 4
+        state = ROTATIONS[shape][index]
+        if rows_collide(rows, width, state, x, y):
+            break  # 这一步旋转被挡住, 之后的旋转状态也无法到达
+        canonical = CANONICAL[shape][index]
+        reach.setdefault((canonical, x), index)
+        for step in (-1, 1):
+            nx = x + step
+            while not rows_collide(rows, width, state, nx, y):
+                reach.setdefault((canonical, nx), index)
+                nx += step
+    return reach
+
+def build_drop_table(placements, rotations=ROTATIONS):
+    """
+    为每个落点预先计算平移后的行掩码和各列底部偏移, 供 _place 直接查表
+
+    返回:
+        方块名 -> [(旋转序号, x, 行掩码元组, ((列, 该列最下方格子的dy), ...)), ...]
+    """
+    table = {}
+    for name, entries in placements.items():
+        table[name] = []
+        for index, x in entries:
+            rotation = rotations[name][index]
+            masks = tuple(mask << x if x >= 0 else mask >> -x for mask in rotation.masks)
+            bottoms = {}
+            for dy, row in enumerate(rotation.shape):
+                for dx, cell in enumerate(row):
+                    if cell:
+                        bottoms[x + dx] = dy
+            table[name].append((index, x, masks, tuple(bottoms.items())))
+    return table
+
+def _place(rows, width, tops, entry, start_y=0):
+    """
+    按 build_drop_table 的表项将方块从第 start_y 行落下; 调用方需保证该位置没有碰撞
+
+    落点通常由各列顶部高度直接算出; 方块位于悬空结构下方时改为从 start_y 逐行下落
+
+    返回:
+        (新行掩码列表, 消除的行数)
+    """
+    _, _, masks, bottoms = entry
+    y = min(tops[col] - dy for col, dy in bottoms) - 1
+    if y < start_y:
+        y = start_y
+        while (y + len(masks) < len(rows)
+               and not any(rows[y + 1 + dy] & mask for dy, mask in enumerate(masks))):
+            y += 1
+    rows = list(rows)
+    for dy, mask in enumerate(masks):
+        rows[y + dy] |= mask
+    full_row = (1 << width) - 1
+    kept = [row for row in rows if row != full_row]
+    cleared = len(rows) - len(kept)
+    if cleared:
+        rows = [0] * cleared + kept
+    return rows, cleared
+
+def drop_piece(rows, width, rotation, x):
+    """
+    将旋转状态 rotation 从顶部 x 列处直接落下
+
+    返回:
+        (落下并消行后的新行掩码列表, 消除的行数); 顶部已被占据时返回 None
+    """
+    if rows_collide(rows, width, rotation, x, 0):
+        return None
+    bottoms = {}
+    for dy, row in enumerate(rotation.shape):
+        for dx, cell in enumerate(row):
+            if cell:
+                bottoms[x + dx] = dy
+    masks = [mask << x if x >= 0 else mask >> -x for mask in rotation.masks]
+    return _place(rows, width, column_tops(rows, width), (None, x, masks, tuple(bottoms.items())))
+
+def board_features(rows, width):
+    """计算总高度、空洞数和相邻列高度差之和"""
+    height = len(rows)
+    heights = [0] * width
+    covered = 0
+    holes = 0
+    for y in range(_top_row(rows), height):
+        row = rows[y]
+        holes += (covered & ~row).bit_count()
+        top = row & ~covered
+        while top:
+            bit = top & -top
+            heights[bit.bit_length() - 1] = height - y
+            top ^= bit
+        covered |= row
+    bumpiness = sum(map(abs, map(operator.sub, heights, heights[1:])))
+    return sum(heights), holes, bumpiness
+
+def evaluate(rows, width, lines, weights=WEIGHTS):
+    """棋盘启发式得分, 越大越好"""
+    aggregate_height, holes, bumpiness = board_features(rows, width)
+    return (weights['aggregate_height'] * aggregate_height + weights['lines'] * lines
+            + weights['holes'] * holes + weights['bumpiness'] * bumpiness)
+
+def _search(rows, width, candidates, start_y, lookahead):
+    """
+    在(已确认可到达的)候选落点中搜索
+
+    参数:
+        lookahead: None, 或 (下一个方块名, 其落点表, 出生列) —— 同时枚举下一个方块从出生位置可到达的所有落点
+
+    返回:
+        (得分, 旋转序号, x); 没有候选落点时返回 None
+    """
+    tops = column_tops(rows, width)
+    best = None
+    for entry in candidates:
+        after, lines = _place(rows, width, tops, entry, start_y)
+        score = None
+        if lookahead is None:
+            score = evaluate(after, width, lines)
+        else:
+            next_shape, next_entries, spawn_x = lookahead
+            next_reach = reachable_placements(after, width, next_shape, spawn_x, 0, 0)
+            after_tops = column_tops(after, width)
+            for next_entry in next_entries:
+                if next_reach is not None and (next_entry[0], next_entry[1]) not in next_reach:
+                    continue
+                final, next_lines = _place(after, width, after_tops, next_entry)
+                value = evaluate(final, width, lines + next_lines)
+                if score is None or value > score:
+                    score = value
+            if score is None:  # 下一个方块无处可放, 只按当前落点评分
+                score = evaluate(after, width, lines) - 1000
+        # 按整个元组比较, 使并行分块搜索与串行搜索在得分相同时选出同一落点
+        candidate = (score, entry[0], entry[1])
+        if best is None or candidate > best:
+            best = candidate
+    return best
+
+class AutoPlayer:
+    """
+    自动玩家
+
+    参数:
+        width: 棋盘宽度
+        workers: 搜索用的进程数; 默认0, 在当前进程内搜索。单次搜索只需几毫秒,
+                 进程间传递任务与结果的开销往往抵消并行收益, 只有在多核机器上实测更快时才值得开启
+        lookahead: 是否同时枚举下一个方块的落点
+    """
+
+    def __init__(self, width, workers=0, lookahead=True):
+        self.width = width
+        self.spawn_x = width // 2 - 1  # 与 TetrisGame.new_piece 的出生列一致
+        self.placements = build_placements(width)
+        self.drop_table = build_drop_table(self.placements)
+        self.lookahead = lookahead
+        self.workers = workers
+        self._executor = None
+        if workers > 1:
+            # 延迟导入: 多进程模块依赖 _multiprocessing, 浏览器(pygbag)中的CPython没有该模块
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(workers)
+        self.last_seconds = 0.0
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def choose(self, rows, shape, next_shape=None, start=None):
+        """
+        为方块 shape 选出最佳落点
+
+        参数:
+            start: 方块当前的 (x, y, 旋转序号), 默认为出生位置
+
+        返回:
+            (需要转到的旋转序号, x); 没有可到达的落点时返回 None
+        """
+        started = time.perf_counter()
+        x, y, rotation = (self.spawn_x, 0, 0) if start is None else start
+        reach = reachable_placements(rows, self.width, shape, x, y, rotation)
+        candidates = [entry for entry in self.drop_table[shape] if reach is None or (entry[0], entry[1]) in reach]
+        lookahead = (next_shape, self.drop_table[next_shape], self.spawn_x) if self.lookahead and next_shape else None
+        if self._executor is None:
+            results = [_search(rows, self.width, candidates, y, lookahead)]
+        else:
+            chunks = [candidates[i::self.workers] for i in range(self.workers)]
+            futures = [self._executor.submit(_search, rows, self.width, chunk, y, lookahead)
+                       for chunk in chunks if chunk]
+            results = [future.result() for future in futures]
+        results = [r for r in results if r is not None]
+        self.last_seconds = time.perf_counter() - started
+        if not results:
+            return None
+        _, canonical, x = max(results)
+        return (canonical if reach is None else reach[canonical, x]), x
+
+    def choose_for(self, game):
+        """为 TetrisGame 的当前方块(从其当前位置出发)选出最佳落点"""
+        piece = game.current_piece
+        return self.choose(game.board.rows, piece['shape'], game.next_piece['shape'],
+                           start=(piece['x'], piece['y'], piece['rotation']))
+
+    def plan(self, game):
+        """
+        生成把当前方块移到最佳落点的动作序列: 原地旋转、同一行平移后快速下落
+
+        各动作之间不应插入下落; 实时模式下若方块在执行途中被重力移动导致动作失败, 应重新规划
+
+        返回:
+            动作名列表
+        """
+        choice = self.choose_for(game)
+        if choice is None:
+            return ['drop']
+        rotation, x = choice
+        piece = game.current_piece
+        turns = (rotation - piece['rotation']) % 4
+        dx = x - piece['x']
+        return ['rotate'] * turns + ['left' if dx < 0 else 'right'] * abs(dx) + ['drop']
+
+    def play_piece(self, game):
+        """
+        逐步模式下放置一个方块: 规划的旋转与平移不触发下落, 最后一步 'drop' 经 step() 落下并固定
+
+        返回:
+            (消除的行数, 游戏是否结束)
+        """
+        if game.game_over:
+            return 0, True
+        actions = self.plan(game)
+        for action in actions[:-1]:
+            game.apply_action(action)
+        return game.step(actions[-1])
@@ -0,0 +1,156 @@
+"""批量俄罗斯方块环境: N 个棋盘存放在一个NumPy数组中, 每步对所有对局同时执行一个动作向量
+
+规则与 tetris_engine.TetrisGame.step() 相同(执行动作后下落一格, 无法下落则固定、消行并换下一个方块),
+碰撞检测、固定与消行都以数组运算在整个批次上完成, 适合上万局并行的机器人训练
+"""
+import numpy as np
+
+from tetris_engine import SHAPES, ROTATIONS, ACTIONS
+
+PIECE_NAMES = tuple(SHAPES)
+
+def build_offsets(rotations=ROTATIONS, names=PIECE_NAMES):
+    """
+    将旋转表转换为格子偏移数组
+
+    返回:
+        形状为 (方块种类, 4, 每个方块格数, 2) 的整数数组, 最后一维为 (dy, dx)
+    """
+    offsets = [[[(y, x) for y, row in enumerate(rotation.shape) for x, cell in enumerate(row) if cell]
+                for rotation in rotations[name]]
+               for name in names]
+    return np.array(offsets, dtype=np.intp)
+
+OFFSETS = build_offsets()
+
+LEFT, RIGHT, DOWN, ROTATE, DROP = (ACTIONS.index(a) for a in ('left', 'right', 'down', 'rotate', 'drop'))
+
+class BatchTetris:
+    """
+    N 局并行的俄罗斯方块
+
+    boards[n, y, x] 为 0 表示空, 否则为方块序号+1 (序号见 PIECE_NAMES);
+    当前方块由 shape/rotation/x/y 四个长度为 N 的数组描述
+
+    参数:
+        num_envs: 并行对局数
+        width, height: 棋盘尺寸
+        seed: 随机种子或 np.random.Generator
+    """
+
+    def __init__(self, num_envs, width=10, height=20, seed=None):
+        self.num_envs = num_envs
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((num_envs, height, width), dtype=np.uint8)
+        self.shape = np.zeros(num_envs, dtype=np.intp)
+        self.next_shape = np.zeros(num_envs, dtype=np.intp)
+        self.rotation = np.zeros(num_envs, dtype=np.intp)
+        self.x = np.zeros(num_envs, dtype=np.intp)
+        self.y = np.zeros(num_envs, dtype=np.intp)
+        self.score = np.zeros(num_envs, dtype=np.int64)
+        self.lines = np.zeros(num_envs, dtype=np.int64)
+        self.game_over = np.zeros(num_envs, dtype=bool)
+        self.reset()
+
+    def reset(self, mask=None):
+        """重新开始 mask 选中的对局(默认全部)"""
+        idx = np.arange(self.num_envs) if mask is None else np.flatnonzero(mask)
+        self.boards[idx] = 0
+        self.score[idx] = 0
+        self.lines[idx] = 0
+        self.game_over[idx] = False
+        self.shape[idx] = self.rng.integers(len(PIECE_NAMES), size=idx.size)
+        self.next_shape[idx] = self.rng.integers(len(PIECE_NAMES), size=idx.size)
+        self._spawn_at(idx)
+
+    def _spawn_at(self, idx):
+        self.rotation[idx] = 0
+        self.x[idx] = self.width // 2 - 1
+        self.y[idx] = 0
+
+    def _cells(self, idx, rotation, x, y):
+        """对局 idx 中方块各格的行、列坐标, 形状均为 (len(idx), 每个方块格数)"""
+        offsets = OFFSETS[self.shape[idx], rotation]
+        return y[:, None] + offsets[..., 0], x[:, None] + offsets[..., 1]
+
+    def collides(self, idx, rotation, x, y):
+        """对局 idx 中当前方块以给定旋转放在 (x, y) 时是否越界或重叠; 棋盘顶部以上不算碰撞"""
+        rows, cols = self._cells(idx, rotation, x, y)
+        out = (cols < 0) | (cols >= self.width) | (rows >= self.height)
+        inside = ~out & (rows >= 0)
+        hit = np.zeros(rows.shape, dtype=bool)
+        env = np.broadcast_to(idx[:, None], rows.shape)
+        hit[inside] = self.boards[env[inside], rows[inside], cols[inside]] != 0
+        return (out | hit).any(axis=1)
+
+    def _try_move(self, idx, dx=0, dy=0, drotation=0):
+        """尝试移动/旋转对局 idx 中的方块, 返回成功移动的布尔数组"""
+        rotation = (self.rotation[idx] + drotation) % 4
+        x = self.x[idx] + dx
+        y = self.y[idx] + dy
+        ok = ~self.collides(idx, rotation, x, y)
+        moved = idx[ok]
+        self.rotation[moved] = rotation[ok]
+        self.x[moved] = x[ok]
+        self.y[moved] = y[ok]
+        return ok
+
+    def _hard_drop(self, idx):
+        while idx.size:
+            idx = idx[self._try_move(idx, dy=1)]
+
+    def _lock(self, idx):
+        rows, cols = self._cells(idx, self.rotation[idx], self.x[idx], self.y[idx])
+        env = np.broadcast_to(idx[:, None], rows.shape)
+        visible = rows >= 0
+        self.boards[env[visible], rows[visible], cols[visible]] = (self.shape[env[visible]] + 1).astype(np.uint8)
+
+    def _clear_lines(self, idx):
+        """消除对局 idx 中的满行, 返回每局消除的行数"""
+        full = self.boards[idx].all(axis=2)
+        cleared = full.sum(axis=1)
+        hit = cleared > 0
+        if hit.any():
+            envs = idx[hit]
+            full = full[hit]
+            # 稳定排序把满行移到顶部, 其余行保持原有顺序沉到底部, 再将顶部清空
+            order = np.argsort(~full, axis=1, kind='stable')
+            boards = np.take_along_axis(self.boards[envs], order[:, :, None], axis=1)
+            boards[np.arange(self.height) < cleared[hit][:, None]] = 0
+            self.boards[envs] = boards
+        return cleared
+
+    def step(self, actions):
+        """
+        对所有未结束的对局执行一步: 先执行动作, 再下落一格
+
+        参数:
+            actions: 长度为 num_envs 的整数数组, 取值为 ACTIONS 中的序号
+
+        返回:
+            (每局本步消除的行数, 每局是否结束)
+        """
+        actions = np.asarray(actions)
+        active = ~self.game_over
+        for action, kwargs in ((LEFT, {'dx': -1}), (RIGHT, {'dx': 1}), (DOWN, {'dy': 1}),
+                               (ROTATE, {'drotation': 1})):
+            idx = np.flatnonzero(active & (actions == action))
+            if idx.size:
+                self._try_move(idx, **kwargs)
+        self._hard_drop(np.flatnonzero(active & (actions == DROP)))
+
+        lines = np.zeros(self.num_envs, dtype=np.int64)
+        idx = np.flatnonzero(active)
+        landed = idx[~self._try_move(idx, dy=1)]
+        if landed.size:
+            self._lock(landed)
+            lines[landed] = self._clear_lines(landed)
+            self.lines += lines
+            self.score += lines * 100
+            self.shape[landed] = self.next_shape[landed]
+            self.next_shape[landed] = self.rng.integers(len(PIECE_NAMES), size=landed.size)
+            self._spawn_at(landed)
+            self.game_over[landed] = self.collides(landed, self.rotation[landed], self.x[landed], self.y[landed])
+        return lines, self.game_over.copy()
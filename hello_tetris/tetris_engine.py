@@ -0,0 +1,277 @@
+"""俄罗斯方块无界面核心引擎: 棋盘每行用一个整数位掩码表示, 方块的每个旋转状态预先计算为行掩码
+
+TetrisGame 为不依赖pygame的纯逻辑游戏, 时钟与随机数源均可注入, 可按显式动作逐步推进,
+便于在工作进程中大量运行对局(AI训练、回归测试)
+"""
+import random
+import time
+from collections import namedtuple
+
+# 方块形状
+SHAPES = {
+    'I': [[1, 1, 1, 1]],
+    'O': [[1, 1],
+          [1, 1]],
+    'T': [[0, 1, 0],
+          [1, 1, 1]],
+    'S': [[0, 1, 1],
+          [1, 1, 0]],
+    'Z': [[1, 1, 0],
+          [0, 1, 1]],
+    'J': [[1, 0, 0],
+          [1, 1, 1]],
+    'L': [[0, 0, 1],
+          [1, 1, 1]]
+}
+
+# 一个旋转状态: 形状矩阵, 每行的位掩码(第0列为最低位), 有方块的最左/最右列
+Rotation = namedtuple('Rotation', ['shape', 'masks', 'min_col', 'max_col'])
+
+def rotate_shape(shape):
+    """顺时针旋转形状矩阵"""
+    return [list(row) for row in zip(*shape[::-1])]
+
+def make_rotation(shape):
+    """由形状矩阵生成旋转状态"""
+    masks = [sum(1 << x for x, cell in enumerate(row) if cell) for row in shape]
+    filled = [x for row in shape for x, cell in enumerate(row) if cell]
+    return Rotation(shape, masks, min(filled), max(filled))
+
+def build_rotations(shapes):
+    """为每种方块预计算4个旋转状态"""
+    table = {}
+    for name, shape in shapes.items():
+        rotations = []
+        for _ in range(4):
+            rotations.append(make_rotation(shape))
+            shape = rotate_shape(shape)
+        table[name] = rotations
+    return table
+
+ROTATIONS = build_rotations(SHAPES)
+
+def column_range(rotation, width):
+    """旋转状态在宽度为 width 的棋盘上合法的 x 取值范围(含两端)"""
+    return -rotation.min_col, width - 1 - rotation.max_col
+
+def build_placements(width, rotations=ROTATIONS):
+    """
+    为每种方块列出所有不重复的落点
+
+    返回:
+        方块名 -> [(旋转序号, x), ...]; 形状相同的旋转状态(如O块的4个、I/S/Z块的后2个)只保留第一个
+    """
+    table = {}
+    for name, states in rotations.items():
+        placements = []
+        seen = []
+        for index, rotation in enumerate(states):
+            if rotation.shape in seen:
+                continue
+            seen.append(rotation.shape)
+            x_min, x_max = column_range(rotation, width)
+            placements.extend((index, x) for x in range(x_min, x_max + 1))
+        table[name] = placements
+    return table
+
+def rows_collide(rows, width, rotation, x, y):
+    """在行掩码列表 rows 上, 方块以旋转状态 rotation 放在 (x, y) 时是否越界或与已有方块重叠"""
+    if x + rotation.min_col < 0 or x + rotation.max_col >= width:
+        return True
+    for dy, mask in enumerate(rotation.masks):
+        row = y + dy
+        if row < 0:
+            continue
+        if row >= len(rows):
+            return True
+        if rows[row] & (mask << x if x >= 0 else mask >> -x):
+            return True
+    return False
+
+class Board:
+    """
+    位掩码棋盘: rows[y] 的第 x 位表示 (x, y) 处有方块;
+    cells 为与之同步的颜色层, 只用于渲染
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        self.rows = [0] * height
+        self.cells = [[0] * width for _ in range(height)]
+
+    def collides(self, rotation, x, y):
+        """方块以旋转状态 rotation 放在 (x, y) 时是否越界或与已有方块重叠"""
+        return rows_collide(self.rows, self.width, rotation, x, y)
+
+    def lock(self, rotation, x, y, value):
+        """将方块固定到棋盘上, value 写入颜色层; 位于棋盘顶部以上的部分被忽略"""
+        for dy, row_cells in enumerate(rotation.shape):
+            row = y + dy
+            if row < 0:
+                continue
+            self.rows[row] |= rotation.masks[dy] << x if x >= 0 else rotation.masks[dy] >> -x
+            for dx, cell in enumerate(row_cells):
+                if cell:
+                    self.cells[row][x + dx] = value
+
+    def clear_lines(self):
+        """消除所有满行, 返回消除的行数"""
+        keep = [y for y, mask in enumerate(self.rows) if mask != self.full_row]
+        cleared = self.height - len(keep)
+        if cleared:
+            self.rows = [0] * cleared + [self.rows[y] for y in keep]
+            self.cells = [[0] * self.width for _ in range(cleared)] + [self.cells[y] for y in keep]
+        return cleared
+
+# step() 接受的动作
+ACTIONS = ('none', 'left', 'right', 'down', 'rotate', 'drop')
+
+def monotonic_ticks():
+    """默认时钟: 单调递增的毫秒数"""
+    return int(time.monotonic() * 1000)
+
+class TetrisGame:
+    """
+    纯逻辑俄罗斯方块
+
+    参数:
+        width, height: 棋盘尺寸
+        drop_interval: 自动下落间隔(毫秒), 只在 update() 中使用
+        get_ticks: 返回当前毫秒数的时钟函数, 默认为单调时钟
+        rng: 提供 choice() 的随机数源, 例如 random.Random(seed)
+        colors: 方块名 -> 写入棋盘颜色层的值, 默认直接写入方块名
+    """
+
+    def __init__(self, width=10, height=20, drop_interval=500, get_ticks=None, rng=None, colors=None):
+        self.width = width
+        self.height = height
+        self.drop_interval = drop_interval
+        self.get_ticks = get_ticks or monotonic_ticks
+        self.rng = rng if rng is not None else random.Random()
+        self.colors = colors
+        self.reset()
+
+    def reset(self):
+        """开始新的一局"""
+        self.board = Board(self.width, self.height)
+        self.current_piece = self.new_piece()
+        self.next_piece = self.new_piece()
+        self.score = 0
+        self.lines = 0
+        self.pieces = 0
+        self.game_over = False
+        self.last_drop_time = self.get_ticks()
+
+    def new_piece(self):
+        shape = self.rng.choice(list(SHAPES.keys()))
+        return {
+            'shape': shape,
+            'rotation': 0,
+            'x': self.width // 2 - 1,
+            'y': 0,
+            'color': self.colors[shape] if self.colors else shape
+        }
+
+    @property
+    def grid(self):
+        return self.board.cells
+
+    def piece_rotation(self, piece):
+        return ROTATIONS[piece['shape']][piece['rotation']]
+
+    def move_piece(self, dx=0, dy=0):
+        new_x = self.current_piece['x'] + dx
+        new_y = self.current_piece['y'] + dy
+        if not self.check_collision(new_x, new_y):
+            self.current_piece['x'] = new_x
+            self.current_piece['y'] = new_y
+            return True
+        return False
+
+    def rotate_piece(self):
+        rotation = (self.current_piece['rotation'] + 1) % 4
+        if not self.check_collision(self.current_piece['x'],
+                                  self.current_piece['y'], rotation):
+            self.current_piece['rotation'] = rotation
+            return True
+        return False
+
+    def hard_drop(self):
+        while self.move_piece(0, 1):
+            pass
+
+    def check_collision(self, x, y, rotation=None):
+        if rotation is None:
+            rotation = self.current_piece['rotation']
+        return self.board.collides(ROTATIONS[self.current_piece['shape']][rotation], x, y)
+
+    def lock_piece(self):
+        self.board.lock(self.piece_rotation(self.current_piece),
+                        self.current_piece['x'], self.current_piece['y'],
+                        self.current_piece['color'])
+
+    def clear_lines(self):
+        lines_cleared = self.board.clear_lines()
+        self.lines += lines_cleared
+        self.score += lines_cleared * 100
+        return lines_cleared
+
+    def gravity(self):
+        """
+        方块下落一格; 无法下落时固定方块、消行并换上下一个方块
+
+        返回:
+            本次消除的行数
+        """
+        if self.move_piece(0, 1):
+            return 0
+        self.lock_piece()
+        lines_cleared = self.clear_lines()
+        self.pieces += 1
+        self.current_piece = self.next_piece
+        self.next_piece = self.new_piece()
+        if self.check_collision(self.current_piece['x'],
+                              self.current_piece['y']):
+            self.game_over = True
+        return lines_cleared
+
+    def update(self):
+        """实时模式: 按注入的时钟每隔 drop_interval 毫秒下落一格"""
+        current_time = self.get_ticks()
+        if current_time - self.last_drop_time > self.drop_interval:
+            self.gravity()
+            self.last_drop_time = current_time
+
+    def step(self, action='none'):
+        """
+        逐步模式: 执行一个动作后下落一格, 与时钟无关
+
+        参数:
+            action: ACTIONS 中的动作名
+
+        返回:
+            (本步消除的行数, 游戏是否结束)
+        """
+        if self.game_over:
+            return 0, True
+        self.apply_action(action)
+        return self.gravity(), self.game_over
+
+    def apply_action(self, action):
+        """执行一个动作(不含下落), 返回是否生效"""
+        if action == 'left':
+            return self.move_piece(-1)
+        if action == 'right':
+            return self.move_piece(1)
+        if action == 'down':
+            return self.move_piece(0, 1)
+        if action == 'rotate':
+            return self.rotate_piece()
+        if action == 'drop':
+            self.hard_drop()
+            return True
+        if action != 'none':
+            raise ValueError(f"未知动作: {action}")
+        return False